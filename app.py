@@ -1,23 +1,88 @@
-from flask import Flask, render_template, redirect, url_for
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, render_template, redirect, url_for, g, flash, jsonify, request, stream_with_context
+from markupsafe import Markup
 from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
+from flask_wtf.csrf import generate_csrf
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import and_, or_, bindparam, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached, joinedload, selectinload
 from forms import *
+import migrations
+import cache
+import passwords
+import events
+import boardfile
+import metrics
+import queries
+import search
+import replicas
+import assets
+import startup
+import ratelimit
+import io
+import sqlite3
+import json
+import click
+import sys
+import threading
 import uuid
+from collections import defaultdict, namedtuple
+from functools import wraps
 from datetime import datetime
 from os import environ
 
 
+SETUP_STARTED = time.perf_counter()
 app = Flask(__name__)
+# Heroku's router, or whatever proxy PROXY_HOPS counts, sets the client 
+# address in X-Forwarded-For; the rate limiter keys signed-out users by it.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(environ.get('PROXY_HOPS', 1)), 
+    x_proto=int(environ.get('PROXY_HOPS', 1)))
 app.config['SECRET_KEY'] = environ.get('SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = environ.get('DATABASE_URL')
 Bootstrap(app)
-db = SQLAlchemy(app)
+static_assets = assets.from_environ(environ)
+static_assets.init_app(app)
+startup.use_bytecode_cache(app, environ.get('TEMPLATE_CACHE_DIR'))
+app.jinja_env.globals['csrf_token'] = generate_csrf
+db = replicas.RoutingSQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+COMMENTS_PER_PAGE = 50
+BOARDS_PER_PAGE = 50
+TICKETS_PER_PAGE = 50
+TICKET_STATUS_FILTERS = {
+    'not-started': ['', ' '], 
+    'working': ['Working On It'], 
+    'completed': ['Completed'],
+}
+TRANSFER_BATCH = 1000
+WARM_UP_PATHS = ['/login', '/signup', '/faq']
+EVENT_STREAM_SECONDS = int(environ.get('EVENT_STREAM_SECONDS', 60))
+EVENT_POLL_SECONDS = int(environ.get('EVENT_POLL_SECONDS', 15))
+# Each open stream holds a worker thread, so only this many per worker may 
+# be open at once; viewers past it poll instead.
+event_stream_slots = threading.BoundedSemaphore(int(environ.get('EVENT_STREAMS_MAX', 4)))
+board_cache = cache.from_environ(environ, 
+    release=startup.release_digest(app, static_assets.release))
+board_events = events.from_environ(environ)
+hasher = passwords.from_environ(environ)
+user_cache = cache.TTLCache(max_entries=int(environ.get('USER_CACHE_SIZE', 1024)), 
+    ttl=float(environ.get('USER_CACHE_TTL', 60)))
+request_metrics = metrics.Metrics(app, sample_rate=float(environ.get('METRICS_SAMPLE_RATE', 1)))
+query_watch = queries.from_environ(environ)
+query_watch.init_app(app)
+read_replicas = replicas.from_environ(environ)
+read_replicas.init_app(app)
+rate_limiter = ratelimit.from_environ(environ)
+rate_limiter.init_app(app)
+
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,67 +99,849 @@ class Board(db.Model):
     owner = db.Column(db.String(15))
     private = db.Column(db.String)
     description = db.Column(db.String(500))
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    working_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    unassigned_count = db.Column(db.Integer, nullable=False, default=0)
+
+    collaborators = db.relationship('Collaborator', backref='board', order_by='Collaborator.id')
+    groups = db.relationship('Group', backref='board', order_by='Group.id')
 
 
 class Collaborator(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    board_id = db.Column(db.String())
+    board_id = db.Column(db.Integer, db.ForeignKey('board.id'))
     user_id = db.Column(db.String())
-    board_title = db.Column(db.String())
 
 
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    board_id = db.Column(db.String())
+    board_id = db.Column(db.Integer, db.ForeignKey('board.id'))
     title = db.Column(db.String())
     public_id = db.Column(db.String)
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    working_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    unassigned_count = db.Column(db.Integer, nullable=False, default=0)
+
+    tickets = db.relationship('Ticket', backref='group', order_by='Ticket.id')
 
 
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.String())
-    board_id = db.Column(db.String())
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'))
+    board_id = db.Column(db.Integer, db.ForeignKey('board.id'))
     public_id = db.Column(db.String())
     text = db.Column(db.String(200))
     status = db.Column(db.String())
 
+    assignees = db.relationship('Assignee', backref='ticket', order_by='Assignee.id')
+    comments = db.relationship('Comment', backref='ticket', lazy='dynamic')
+
 
 class Assignee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    ticket_id = db.Column(db.String())
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'))
     user_id = db.Column(db.String())
-    board_id = db.Column(db.String())
-    group_id = db.Column(db.String())
+    board_id = db.Column(db.Integer, db.ForeignKey('board.id'))
+    # A copy of the ticket's status, so a user's tickets can be listed by
+    # status from one index. Every route that sets Ticket.status updates it.
+    status = db.Column(db.String(), nullable=False, default='', server_default='')
 
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    ticket_id = db.Column(db.String())
-    group_id = db.Column(db.String())
-    board_id = db.Column(db.String())
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'))
+    board_id = db.Column(db.Integer, db.ForeignKey('board.id'))
     user_id = db.Column(db.String())
     text = db.Column(db.String(2000))
     public_id = db.Column(db.String())
-    timestamp = db.Column(db.String())
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+@event.listens_for(Engine, 'connect')
+def enforce_foreign_keys(dbapi_connection, connection_record):
+    # SQLite leaves foreign keys unchecked unless each connection asks.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+
+BoardSnapshot = namedtuple('BoardSnapshot', ['board', 'collabs', 'groups'])
+
+
+def load_board_snapshot(board, tickets=True):
+    """Load everything the board page needs in three queries.
+
+    Groups come with their tickets, and the tickets with their assignees,
+    eagerly loaded, so walking them in the template issues no more SQL.
+    With tickets=False only the groups are loaded, in two queries.
+    """
+    collabs = board.collaborators
+    groups = Group.query.filter_by(board_id=board.id).order_by(Group.id)
+
+    if tickets:
+        groups = groups.options(selectinload(Group.tickets).joinedload(Ticket.assignees))
+
+    groups = groups.all()
+
+    return BoardSnapshot(board, collabs, groups)
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    """Create missing tables and apply pending schema migrations."""
+    db.create_all()
+
+    for version, description in migrations.upgrade(db.engine):
+        click.echo('Applied migration %d: %s' % (version, description))
+
+    click.echo('Schema is at version %d' % migrations.current_version(db.engine))
+
+
+def route_queries():
+    """Representative lookups issued by each route, keyed by a short label."""
+    board_id, group_id, ticket_id, username = 1, 1, 1, 'someone'
+
+    return {
+        'index: boards': user_boards_query(username).order_by(Board.updated_at.desc(), 
+            Board.id.desc()).limit(BOARDS_PER_PAGE + 1),
+        'login: user by username': User.query.filter_by(username=username),
+        'board: access check': board_access_query('abc1234', username),
+        'add_collab: existing collaborator': Collaborator.query.filter_by(board_id=board_id, user_id=username),
+        'board: collaborators': Collaborator.query.filter_by(board_id=board_id),
+        'board: groups': Group.query.filter_by(board_id=board_id),
+        'board: tickets': Ticket.query.filter(Ticket.group_id.in_([group_id])),
+        'board: assignees': Assignee.query.filter(Assignee.ticket_id.in_([ticket_id])),
+        'group: by public_id': Group.query.filter_by(board_id=board_id, public_id='def5678'),
+        'group: tickets': Ticket.query.filter_by(group_id=group_id),
+        'ticket: by public_id': Ticket.query.filter_by(board_id=board_id, public_id='ghi9012'),
+        'my tickets: by user and status': my_tickets_query(username, 
+            TICKET_STATUS_FILTERS['working']).limit(TICKETS_PER_PAGE + 1),
+        'ticket: assignee check': Assignee.query.filter_by(user_id=username, ticket_id=ticket_id),
+        'ticket: assignees': Assignee.query.filter_by(ticket_id=ticket_id),
+        'ticket: comments': Comment.query.filter_by(ticket_id=ticket_id
+            ).order_by(Comment.created_at.desc(), Comment.id.desc()).limit(COMMENTS_PER_PAGE + 1),
+        'comment: by public_id': Comment.query.filter_by(board_id=board_id, public_id='jkl3456'),
+    }
+
+
+@app.cli.command('reconcile-progress')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it.')
+def reconcile_progress(dry_run):
+    """Recount progress counters from the tickets and report any drift."""
+    with db.engine.begin() as conn:
+        drift = migrations.rebuild_progress(conn, fix=not dry_run)
+
+    for table, public_id, column, stored, actual in drift:
+        click.echo('%s %s: %s was %d, counted %d' % (table, public_id, column, stored, actual))
+
+    click.echo('%d counters %s' % (len(drift), 'drifted' if dry_run else 'fixed'))
+
+
+@app.cli.command('explain-queries')
+def explain_queries():
+    """Print the database's query plan for each route query."""
+    dialect = db.engine.dialect
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+
+    for label, query in route_queries().items():
+        sql = str(query.statement.compile(dialect=dialect, 
+            compile_kwargs={'literal_binds': True}))
+
+        click.echo('== %s' % label)
+
+        for row in db.session.execute(prefix + sql):
+            click.echo('   ' + ' '.join(str(col) for col in row))
+
+
+def ticket_progress(status, assigned):
+    """What one ticket adds to its group's and board's progress counters."""
+    return {
+        'ticket_count': 1, 
+        'working_count': int(status == 'Working On It'), 
+        'completed_count': int(status == 'Completed'), 
+        'unassigned_count': int(not assigned),
+    }
+
+
+def progress_delta():
+    """Counter changes by group_id, filled in with add_progress."""
+    return defaultdict(lambda: dict.fromkeys(migrations.PROGRESS_COLUMNS, 0))
+
+
+def add_progress(delta, group_id, status, assigned, sign=1):
+    for column, n in ticket_progress(status, assigned).items():
+        delta[group_id][column] += sign * n
+
+
+def touch_board(board, progress=None):
+    """Bump the board's version so cached renderings of it are not reused.
+
+    Call from every route that changes what the board page shows, before
+    the commit so the bump lands in the same transaction. It also marks the
+    board's last activity. progress is a 
+    progress_delta() for the tickets the route changed; its counters are 
+    added to the groups and the board in the same transaction, and 
+    announce() sends the new values to viewers.
+    """
+    values = {Board.version: Board.version + 1, Board.updated_at: datetime.now()}
+
+    changed = {group_id: counts for group_id, counts in (progress or {}).items() 
+        if any(counts.values())}
+
+    if changed:
+        # One executemany covers every group the route touched.
+        db.session.execute(Group.__table__.update().where(
+            Group.id == bindparam('group_id')).values({column: 
+                getattr(Group, column) + bindparam('d_' + column) 
+                for column in migrations.PROGRESS_COLUMNS}), 
+            [dict({'d_' + column: n for column, n in counts.items()}, group_id=group_id) 
+                for group_id, counts in changed.items()])
+
+        for column in migrations.PROGRESS_COLUMNS:
+            values[getattr(Board, column)] = getattr(Board, column) + sum(
+                counts[column] for counts in changed.values())
+
+        g.progress_groups = list(changed)
+
+    Board.query.filter_by(id=board.id).update(values, synchronize_session=False)
+
+
+def announce(board_id, *changes):
+    """Push changes to everyone watching the board's event stream.
+
+    Call after the commit, so viewers never see a change that was rolled 
+    back. The payload carries the board version the changes produced; a 
+    viewer that spots a gap reloads the page instead of patching it.
+    """
+    changes = list(changes)
+
+    if 'progress_groups' in g:
+        groups = Group.query.filter(Group.id.in_(g.pop('progress_groups')))
+
+        changes.append({'type': 'progress', 
+            'html': render_template('board/progress.html', item=g.board), 
+            'groups': {group.public_id: render_template('board/progress.html', item=group) 
+                for group in groups}})
+
+    board_events.publish(board_id, {'version': g.board.version, 'changes': changes})
+
+
+def render_board_body(board):
+    """Return the viewer-independent board body, rendered at most once per 
+    board version.
+
+    Groups are rendered collapsed, with their counters but no tickets, so 
+    the page costs the same however many tickets the board holds. Each 
+    group's tickets come from render_group_tickets when it is opened.
+    """
+    key = 'board:%s:%d' % (board.public_id, board.version)
+    body = board_cache.get(key)
+
+    if body is None:
+        snapshot = load_board_snapshot(board, tickets=False)
+
+        body = render_template('board/board_body.html', board=board, 
+            groups=snapshot.groups, collabs=snapshot.collabs)
+
+        board_cache.set(key, body)
+
+    return Markup(body)
+
+
+def render_group_tickets(board, group_id):
+    """Return one group's ticket rows, rendered at most once per board 
+    version, or None when the board has no such group.
+    """
+    key = 'group:%s:%s:%d' % (board.public_id, group_id, board.version)
+    body = board_cache.get(key)
+
+    if body is None:
+        group = Group.query.filter_by(board_id=board.id, public_id=group_id).first()
+
+        if group is None:
+            return None
+
+        tickets = Ticket.query.filter_by(group_id=group.id).order_by(Ticket.id).options(
+            joinedload(Ticket.assignees)).all()
+
+        body = render_template('board/group_tickets.html', board=board, group=group, 
+            tickets=tickets)
+
+        board_cache.set(key, body)
+
+    return Markup(body)
+
+
+def delete_tickets(*criteria):
+    """Bulk delete the tickets matching criteria along with their comments and 
+    assignees, using set-based DELETE statements. Returns row counts.
+    """
+    ticket_ids = db.session.query(Ticket.id).filter(*criteria).subquery()
+
+    counts = {}
+    counts['comments'] = Comment.query.filter(Comment.ticket_id.in_(ticket_ids)
+        ).delete(synchronize_session=False)
+    counts['assignees'] = Assignee.query.filter(Assignee.ticket_id.in_(ticket_ids)
+        ).delete(synchronize_session=False)
+    counts['tickets'] = Ticket.query.filter(*criteria).delete(synchronize_session=False)
+
+    return counts
+
+
+def delete_group_rows(group):
+    counts = delete_tickets(Ticket.group_id == group.id)
+    counts['groups'] = Group.query.filter_by(id=group.id).delete(synchronize_session=False)
+
+    return counts
+
+
+def delete_board_rows(board):
+    counts = delete_tickets(Ticket.board_id == board.id)
+    counts['groups'] = Group.query.filter_by(board_id=board.id).delete(synchronize_session=False)
+    counts['collaborators'] = Collaborator.query.filter_by(board_id=board.id
+        ).delete(synchronize_session=False)
+    counts['boards'] = Board.query.filter_by(id=board.id).delete(synchronize_session=False)
+
+    return counts
+
+
+def export_records(board):
+    """Yield the board's rows as boardfile records.
+
+    Rows are fetched as plain column tuples TRANSFER_BATCH at a time, so 
+    nothing accumulates in the session however large the board is. Rows
+    refer to each other by public_id in the file.
+    """
+    yield {'type': 'board', 'title': board.title, 'description': board.description, 
+        'private': board.private, 'owner': board.owner}
+
+    def rows(model, *columns, parent=None):
+        query = db.session.query(*columns).select_from(model)
+
+        if parent is not None:
+            query = query.join(parent)
+
+        return query.filter(model.board_id == board.id).order_by(model.id).yield_per(TRANSFER_BATCH)
+
+    for user_id, in rows(Collaborator, Collaborator.user_id):
+        yield {'type': 'collaborator', 'user': user_id}
+
+    for public_id, title in rows(Group, Group.public_id, Group.title):
+        yield {'type': 'group', 'id': public_id, 'title': title}
+
+    for public_id, group_id, text, status in rows(Ticket, Ticket.public_id, Group.public_id, 
+            Ticket.text, Ticket.status, parent=Ticket.group):
+        yield {'type': 'ticket', 'id': public_id, 'group': group_id, 'text': text, 'status': status}
+
+    for ticket_id, user_id in rows(Assignee, Ticket.public_id, Assignee.user_id, 
+            parent=Assignee.ticket):
+        yield {'type': 'assignee', 'ticket': ticket_id, 'user': user_id}
+
+    for public_id, ticket_id, user_id, text, created_at in rows(Comment, Comment.public_id, 
+            Ticket.public_id, Comment.user_id, Comment.text, Comment.created_at, 
+            parent=Comment.ticket):
+        yield {'type': 'comment', 'id': public_id, 'ticket': ticket_id, 'user': user_id, 
+            'text': text, 'created_at': created_at.isoformat()}
+
+
+def import_records(records, owner):
+    """Create a new board owned by owner from boardfile records.
+
+    Every board, group, ticket and comment gets a fresh public_id, and rows
+    are written with bulk inserts TRANSFER_BATCH at a time. The ids are 12
+    characters rather than the usual 7, which a 100k-ticket import would 
+    be all but certain to collide on. Rows that refer
+    to something the file does not contain are skipped. The file's owner 
+    comes back as a collaborator, and only people who still have an 
+    account become collaborators or stay assigned to tickets. Raises ValueError
+    on a malformed file; the caller rolls back. Returns (board, counts).
+    """
+    board = None
+    groups = {}
+    tickets = {}
+    statuses = {}
+    collaborators = []
+    members = None
+    pending = defaultdict(list)
+    counts = defaultdict(int)
+    progress = progress_delta()
+
+    def add(model, row, name=None):
+        pending[model].append(row)
+
+        if name:
+            counts[name] += 1
+
+        if len(pending[model]) >= TRANSFER_BATCH:
+            db.session.bulk_insert_mappings(model, pending.pop(model))
+
+    def row_ids(model, file_ids):
+        """Insert model's pending rows and map the file's ids for them to row 
+        ids. file_ids maps file ids to the public_ids the rows were given."""
+        if model in pending:
+            db.session.bulk_insert_mappings(model, pending.pop(model))
+
+        by_public_id = dict(db.session.query(model.public_id, model.id).filter(
+            model.board_id == board.id))
+
+        return {file_id: by_public_id[public_id] for file_id, public_id in file_ids.items()}
+
+    def member_names():
+        """The owner and the file's collaborators who still have an account."""
+        names = set(collaborators)
+
+        if names:
+            names = {username for username, in db.session.query(User.username).filter(
+                User.username.in_(names))}
+
+        return names | {owner}
+
+    group_ids = ticket_ids = None
+
+    for record in records:
+        kind = record['type']
+
+        if (board is None) != (kind == 'board'):
+            raise ValueError("The file must hold exactly one board, before everything else.")
+
+        if kind == 'board':
+            board = Board(public_id=new_public_id(), title=record.get('title'), owner=owner, 
+                description=record.get('description'), 
+                private='Public' if record.get('private') == 'Public' else 'Private')
+
+            db.session.add(board)
+            db.session.flush()
+
+            if record.get('owner') and record['owner'] != owner:
+                collaborators.append(record['owner'])
+
+        elif kind == 'collaborator':
+            if record.get('user') and record['user'] != owner:
+                collaborators.append(record['user'])
+
+        elif kind == 'group':
+            if group_ids is not None:
+                raise ValueError("Groups must come before tickets.")
+
+            groups[record['id']] = new_public_id()
+            add(Group, {'public_id': groups[record['id']], 'board_id': board.id, 
+                'title': record.get('title')}, 'groups')
+
+        elif kind == 'ticket':
+            if ticket_ids is not None:
+                raise ValueError("Tickets must come before assignees and comments.")
+
+            if group_ids is None:
+                group_ids = row_ids(Group, groups)
+
+            group_id = group_ids.get(record.get('group'))
+
+            if group_id is not None:
+                tickets[record['id']] = new_public_id()
+                status = record.get('status') or ''
+                statuses[record['id']] = status
+                add(Ticket, {'public_id': tickets[record['id']], 'board_id': board.id, 
+                    'group_id': group_id, 'text': record.get('text'), 'status': status}, 'tickets')
+
+                # Counted as assigned here; unassigned ones are added below.
+                add_progress(progress, group_id, status, True)
+
+        elif kind in ('assignee', 'comment'):
+            if ticket_ids is None:
+                ticket_ids = row_ids(Ticket, tickets)
+                members = member_names()
+
+            ticket_id = ticket_ids.get(record.get('ticket'))
+
+            if ticket_id is None:
+                continue
+
+            if kind == 'assignee':
+                if record.get('user') not in members:
+                    continue
+
+                add(Assignee, {'ticket_id': ticket_id, 'board_id': board.id, 
+                    'user_id': record.get('user'), 'status': statuses[record['ticket']]}, 'assignees')
+            else:
+                created_at = record.get('created_at')
+                add(Comment, {'public_id': new_public_id(), 'ticket_id': ticket_id, 'board_id': board.id, 
+                    'user_id': record.get('user'), 'text': record.get('text'), 
+                    'created_at': datetime.fromisoformat(created_at) if created_at else datetime.now()}, 
+                    'comments')
+
+        else:
+            raise ValueError("Unknown record type %r." % kind)
+
+    if board is None:
+        raise ValueError("The file holds no board.")
+
+    if members is None:
+        members = member_names()
+
+    for username in sorted(members - {owner}):
+        add(Collaborator, {'board_id': board.id, 'user_id': username}, 'collaborators')
+
+    for model in (Collaborator, Group, Ticket, Assignee, Comment):
+        if model in pending:
+            db.session.bulk_insert_mappings(model, pending.pop(model))
+
+    # Tickets without assignees, counted per group in one query.
+    unassigned = db.session.query(Ticket.group_id, db.func.count(Ticket.id)).filter(
+        Ticket.board_id == board.id, ~Ticket.assignees.any()).group_by(Ticket.group_id)
+
+    for group_id, n in unassigned:
+        progress[group_id]['unassigned_count'] += n
+
+    touch_board(board, progress)
+
+    return board, counts
+
+
+def describe_counts(counts):
+    return ', '.join('%d %s' % (n, name) for name, n in counts.items() if n)
+
+
+def error_page(message, status=200):
+    if request.path.startswith('/api/'):
+        return jsonify(error=message), status
+
+    return render_template('error.html', message=message, 
+        name=current_user.username), status
+
+
+def user_boards_query(username):
+    """Boards the user owns or collaborates on, in one query."""
+    return Board.query.filter(or_(Board.owner == username, 
+        Board.id.in_(db.session.query(Collaborator.board_id).filter(
+            Collaborator.user_id == username))))
+
+
+def my_tickets_query(username, statuses=None):
+    """The user's assigned tickets with their group and board, newest first
+    within each status. Walks ix_assignee_user_status, in one query."""
+    query = db.session.query(Assignee.id, Assignee.status, Ticket.public_id.label('ticket_id'), 
+        Ticket.text, Group.public_id.label('group_id'), Group.title.label('group_title'), 
+        Board.public_id.label('board_id'), Board.title.label('board_title')
+        ).join(Assignee.ticket).join(Ticket.group).join(Group.board).filter(
+            Assignee.user_id == username, 
+            or_(Board.owner == username, Board.id.in_(db.session.query(Collaborator.board_id).filter(
+                Collaborator.user_id == username))))
+
+    if statuses is not None:
+        query = query.filter(Assignee.status.in_(statuses))
+
+    return query.order_by(Assignee.status.desc(), Assignee.id.desc())
+
+
+def board_access_query(board_id, username):
+    return db.session.query(Board, Collaborator.id).outerjoin(Collaborator, 
+        and_(Collaborator.board_id == Board.id, 
+            Collaborator.user_id == username)
+        ).filter(Board.public_id == board_id)
+
+
+def resolve_board(board_id):
+    """Return (board, role) for the current user, memoized for the request.
+
+    role is 'owner', 'collaborator' or None. Board and membership come back
+    from a single outer-joined query.
+    """
+    cache = g.setdefault('board_access', {})
+
+    if board_id not in cache:
+        row = board_access_query(board_id, current_user.username).first()
+
+        if row is None:
+            cache[board_id] = (None, None)
+        else:
+            board, collab_id = row
+
+            if board.owner == current_user.username:
+                role = 'owner'
+            elif collab_id is not None:
+                role = 'collaborator'
+            else:
+                role = None
+
+            cache[board_id] = (board, role)
+
+    return cache[board_id]
+
+
+def board_access(level, message):
+    """Load the route's board into g.board and check the caller's role.
+
+    level is 'view' (public board or member), 'member' (creator or
+    collaborator) or 'owner'. Missing boards get a 404 and callers
+    without access get a 403 carrying message.
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            board, role = resolve_board(kwargs['board_id'])
+
+            if board is None:
+                return error_page("Board not found.", 404)
+
+            if level == 'owner':
+                allowed = role == 'owner'
+            elif level == 'member':
+                allowed = role is not None
+            else:
+                allowed = role is not None or board.private == "Public"
+
+            if not allowed:
+                return error_page(message, 403)
+
+            g.board = board
+            g.board_role = role
+
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def board_row(model, public_id):
+    """The group, ticket or comment of g.board with public_id, or None.
+
+    Rows are always looked up within the board board_access checked, so a 
+    member of one board cannot reach another board's rows through it.
+    """
+    return model.query.filter_by(board_id=g.board.id, public_id=public_id).first()
+
+
+def new_public_id():
+    """A random id for a new board, group, ticket or comment. Boards need it 
+    unique across the site, the rest within their board, and 48 random bits 
+    make a clash unlikely enough for both."""
+    return uuid.uuid4().hex[:12]
+
+
+@app.errorhandler(429)
+def too_many_requests(e):
+    message = "Too many requests. Please wait a moment and try again."
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+
+    if request.path.startswith('/api/'):
+        return jsonify(error=message), 429, headers
+
+    return render_template('error.html', message=message, 
+        name=getattr(current_user, 'username', None)), 429, headers
+
+
+@app.errorhandler(passwords.Busy)
+def hasher_busy(e):
+    message = "Too many sign-ins right now. Please try again in a moment."
+
+    return render_template('error.html', message=message), 503, {'Retry-After': '1'}
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Fingerprint and precompress static files for long-lived caching."""
+    manifest = static_assets.build()
+
+    click.echo('Built %d assets into %s' % (len(manifest['files']), static_assets.directory))
+
+
+@app.cli.command('bench-passwords')
+@click.option('--costs', default='100000,260000,600000', 
+    help='Comma-separated pbkdf2 iteration counts to try.')
+@click.option('--seconds', default=3.0, help='How long to run each cost.')
+def bench_passwords(costs, seconds):
+    """Measure login throughput at each password hashing cost."""
+    for cost in costs.split(','):
+        method = 'pbkdf2:sha256:%d' % int(cost)
+        rate = passwords.benchmark(method, seconds=seconds, workers=hasher.workers)
+
+        click.echo('%-28s %8.1f logins/s' % (method, rate))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Rehydrate the session user, from this worker's user cache when possible.
+
+    The cache holds column values rather than ORM instances, so every 
+    request gets its own detached User. Routes that write to it must 
+    db.session.add() it first and then call forget_user().
+    """
+    values = user_cache.get(user_id)
+
+    if values is None:
+        user = User.query.get(int(user_id))
+
+        if user is None:
+            return None
+
+        values = {c.name: getattr(user, c.name) for c in User.__table__.columns}
+        user_cache.set(user_id, values)
+
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+
+    return user
+
+
+def forget_user(user):
+    user_cache.delete(str(user.id))
 
 @app.route('/')
 @login_required
 def index():
-    my_boards = Board.query.filter_by(owner=current_user.username).all()
-    my_collabs = Collaborator.query.filter_by(user_id=current_user.username).all()
+    # Most recently active first, one page at a time, with the same 
+    # (updated_at, id) cursor scheme as view_comments.
+    query = user_boards_query(current_user.username)
+
+    if 'before' in request.args:
+        try:
+            before = datetime.fromisoformat(request.args['before'])
+            before_id = int(request.args.get('before_id', 0))
+        except ValueError:
+            return error_page("Invalid board cursor.", 400)
+
+        query = query.filter(or_(Board.updated_at < before, 
+            and_(Board.updated_at == before, Board.id < before_id)))
+
+    boards = query.order_by(Board.updated_at.desc(), Board.id.desc()
+        ).limit(BOARDS_PER_PAGE + 1).all()
+
+    older = None
+
+    if len(boards) > BOARDS_PER_PAGE:
+        boards = boards[:BOARDS_PER_PAGE]
+        older = url_for('index', before=boards[-1].updated_at.isoformat(), 
+            before_id=boards[-1].id)
 
     return render_template('index.html', name=current_user.username, 
-        boards=my_boards, collabs=my_collabs)
+        boards=boards, older=older)
+
+@app.route('/cache-stats')
+@login_required
+def cache_stats():
+    return jsonify(board_cache.stats())
+
+@app.route('/metrics')
+def metrics_text():
+    return request_metrics.exposition() + rate_limiter.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 @app.route('/faq')
 def faq():
     return render_template('faq.html')
 
+def run_search():
+    """(query, page, results, has_more) for the q and page request args."""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results, has_more = search.search(db.session.connection(), query, 
+        current_user.username, page)
+
+    return query, page, results, has_more
+
+@app.route('/search')
+@login_required
+def search_page():
+    if not search.available(db.session.connection()):
+        return error_page("Search is not available on this database.", 501)
+
+    query, page, results, has_more = run_search()
+
+    return render_template('search.html', name=current_user.username, 
+        query=query, page=page, results=results, has_more=has_more)
+
+@app.route('/api/search')
+@login_required
+def search_json():
+    if not search.available(db.session.connection()):
+        return error_page("Search is not available on this database.", 501)
+
+    query, page, results, has_more = run_search()
+
+    return jsonify(
+        query=query, 
+        page=page, 
+        has_more=has_more, 
+        results=[{
+            'kind': result.kind, 
+            'id': result.public_id, 
+            'ticket': result.ticket_id, 
+            'group': result.group_id, 
+            'board': result.board_id, 
+            'board_title': result.board_title, 
+            'snippet_html': str(result.snippet),
+        } for result in results])
+
+def run_my_tickets():
+    """(status filter, tickets, older page URL) for the request args.
+
+    Pages follow the (status, id) cursor in before and before_id, like the
+    index page's. Raises ValueError for an unknown filter or a bad cursor.
+    """
+    status = request.args.get('status', '')
+
+    if status and status not in TICKET_STATUS_FILTERS:
+        raise ValueError("Unknown status filter.")
+
+    query = my_tickets_query(current_user.username, TICKET_STATUS_FILTERS.get(status))
+
+    if 'before' in request.args:
+        before = request.args['before']
+        before_id = int(request.args.get('before_id', 0))
+        query = query.filter(or_(Assignee.status < before, 
+            and_(Assignee.status == before, Assignee.id < before_id)))
+
+    tickets = query.limit(TICKETS_PER_PAGE + 1).all()
+    older = None
+
+    if len(tickets) > TICKETS_PER_PAGE:
+        tickets = tickets[:TICKETS_PER_PAGE]
+        older = url_for(request.endpoint, status=status or None, before=tickets[-1].status, 
+            before_id=tickets[-1].id)
+
+    return status, tickets, older
+
+@app.route('/my-tickets')
+@login_required
+def my_tickets():
+    try:
+        status, tickets, older = run_my_tickets()
+    except ValueError as e:
+        return error_page(str(e), 400)
+
+    return render_template('my_tickets.html', name=current_user.username, 
+        status=status, filters=TICKET_STATUS_FILTERS, tickets=tickets, older=older)
+
+@app.route('/api/my-tickets')
+@login_required
+def my_tickets_json():
+    try:
+        status, tickets, older = run_my_tickets()
+    except ValueError as e:
+        return error_page(str(e), 400)
+
+    return jsonify(
+        status=status or None, 
+        older=older, 
+        tickets=[{
+            'id': ticket.ticket_id, 
+            'text': ticket.text, 
+            'status': ticket.status, 
+            'group': ticket.group_id, 
+            'group_title': ticket.group_title, 
+            'board': ticket.board_id, 
+            'board_title': ticket.board_title, 
+        } for ticket in tickets])
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
@@ -103,7 +950,14 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
 
         if user:
-            if check_password_hash(user.password, form.password.data):
+            if hasher.verify(user.password, form.password.data):
+
+                if hasher.needs_rehash(user.password):
+                    user.password = hasher.hash(form.password.data)
+
+                    db.session.commit()
+                    forget_user(user)
+
                 login_user(user, remember=form.remember.data)
 
                 return redirect(url_for('index'))
@@ -122,8 +976,7 @@ def signup():
     form = RegisterForm()
 
     if form.validate_on_submit():
-        hashed_password = generate_password_hash(form.password.data, 
-            method='sha256')
+        hashed_password = hasher.hash(form.password.data)
 
         username = form.username.data.rstrip()
         email= form.email.data.rstrip()
@@ -139,28 +992,32 @@ def signup():
     return render_template('auth/signup.html', form=form)
 
 @app.route('/profile', methods=['GET', 'POST'])
+@login_required
 def view_profile():
-    user = User.query.filter_by(username=current_user.username).first()
-
-    return render_template("profile/profile.html", user=user, name=current_user.username)
+    return render_template("profile/profile.html", user=current_user, name=current_user.username)
 
 @app.route('/profile/<username>')
 def view_user_profile(username):
-    user = User.query.filter_by(username=username).first()
+    if username == current_user.username:
+        user = current_user
+    else:
+        user = User.query.filter_by(username=username).first()
 
     return render_template("profile/profile.html", user=user, name=current_user.username)
 
 @app.route('/edit-profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
-    user = User.query.filter_by(username=current_user.username).first()
+    user = current_user._get_current_object()
 
     form = ProfileForm(bio=user.bio)
 
     if form.validate_on_submit():
+        db.session.add(user)
         user.bio = form.bio.data
 
         db.session.commit()
+        forget_user(user)
 
         return redirect(url_for('view_profile'))
 
@@ -172,7 +1029,7 @@ def create_board():
     form = BoardForm()
 
     if form.validate_on_submit():
-        public_id = str(uuid.uuid4())[:7]
+        public_id = new_public_id()
 
         new_board = Board(public_id=public_id, title=form.title.data, 
             private="Public", owner=current_user.username, 
@@ -187,39 +1044,159 @@ def create_board():
 
 @app.route('/<board_id>')
 @login_required
+@board_access('view', "Board is private. Must be creator or a collaborator to view this board.")
 def view_board(board_id): 
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
-    
-    if board.private != "Public":
+    board = g.board
+  
+    return render_template('board/board.html', name=current_user.username, 
+        board=board, body=render_board_body(board), is_owner=g.board_role == 'owner')
 
-        if board.owner != current_user.username:
+@app.route('/<board_id>/groups/<group_id>/tickets')
+@login_required
+@board_access('view', "Board is private. Must be creator or a collaborator to view this board.")
+def view_group_tickets(board_id, group_id):
+    body = render_group_tickets(g.board, group_id)
 
-            if collab == None or collab.user_id != current_user.username:
-                message = "Board is private. Must be creator or a collaborator to view this board."   
+    if body is None:
+        return error_page("Group not found.", 404)
 
-                return render_template('error.html', message=message, name=current_user.username) 
+    return body
 
-    collabs = Collaborator.query.filter_by(board_id=board_id).all()
+@app.route('/api/boards/<board_id>')
+@login_required
+@board_access('view', "Board is private. Must be creator or a collaborator to view this board.")
+def board_json(board_id):
+    board = g.board
+
+    # The version is bumped by every change to what the board shows, so it 
+    # identifies the representation and a matching poll costs one lookup.
+    etag = '%s-%d' % (board.public_id, board.version)
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        snapshot = load_board_snapshot(board)
+
+        response = jsonify(
+            id=board.public_id, 
+            title=board.title, 
+            description=board.description, 
+            owner=board.owner, 
+            private=board.private, 
+            version=board.version, 
+            collaborators=[c.user_id for c in snapshot.collabs], 
+            groups=[{
+                'id': group.public_id, 
+                'title': group.title, 
+                'tickets': [{
+                    'id': ticket.public_id, 
+                    'text': ticket.text, 
+                    'status': ticket.status, 
+                    'assignees': [a.user_id for a in ticket.assignees],
+                } for ticket in group.tickets],
+            } for group in snapshot.groups])
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+    return response
+
+@app.route('/api/boards/<board_id>/events')
+@login_required
+@board_access('view', "Board is private. Must be creator or a collaborator to view this board.")
+def board_event_stream(board_id):
+    # The first message only reports the current version, so a page that 
+    # was rendered before a change it missed knows to reload.
+    hello = {'version': g.board.version, 'changes': None}
+
+    if not event_stream_slots.acquire(blocking=False):
+        # No thread to spare: send the version and close at once. The 
+        # browser reconnects after the retry delay, so it polls instead.
+        return app.response_class('retry: %d\n\ndata: %s\n\n' % (EVENT_POLL_SECONDS * 1000, 
+            json.dumps(hello)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    try:
+        subscription = board_events.subscribe(board_id)
+    except Exception:
+        event_stream_slots.release()
+        raise
+
+    def stream():
+        try:
+            yield 'retry: 2000\n\ndata: %s\n\n' % json.dumps(hello)
+
+            # Close after a while so a sync worker is not held forever; the 
+            # browser reconnects on its own.
+            deadline = time.monotonic() + EVENT_STREAM_SECONDS
+
+            while time.monotonic() < deadline:
+                payload = subscription.get(timeout=min(15, deadline - time.monotonic()))
+
+                if payload is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield 'data: %s\n\n' % json.dumps(payload)
+        finally:
+            subscription.close()
+
+    response = app.response_class(stream(), mimetype='text/event-stream', 
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # Runs when the server is done with the response, even if the client 
+    # left before the stream started.
+    response.call_on_close(event_stream_slots.release)
+
+    return response
+
+@app.route('/<board_id>/export')
+@login_required
+@board_access('view', "Board is private. Must be creator or a collaborator to export this board.")
+def export_board(board_id):
+    format = request.args.get('format', 'jsonl')
 
-    groups = Group.query.filter_by(board_id=board_id).all()
+    if format not in boardfile.FORMATS:
+        return error_page("Export format must be one of: %s." % ', '.join(boardfile.FORMATS), 400)
 
-    tickets = Ticket.query.filter_by(board_id=board_id).all()
+    records = export_records(g.board)
 
-    assignees = Assignee.query.filter_by(board_id=board_id).all()
-  
-    return render_template('board/board.html', name=current_user.username, 
-        board=board, groups=groups, collabs=collabs, tickets=tickets, assignees=assignees)
+    return app.response_class(stream_with_context(boardfile.encode(records, format)), 
+        mimetype=boardfile.FORMATS[format], headers={'Content-Disposition': 
+            'attachment; filename="board-%s.%s"' % (board_id, format)})
 
-@app.route('/<board_id>/update', methods=['GET', 'POST'])
+@app.route('/import', methods=['GET', 'POST'])
 @login_required
-def update_board(board_id):
-    board = Board.query.filter_by(public_id=board_id).first()
+def import_board():
+    form = ImportForm()
+
+    if form.validate_on_submit():
+        upload = form.file.data
+        format = boardfile.format_of(upload.filename or '')
+
+        if format is None:
+            return error_page("Import a .jsonl or .csv board export.", 400)
+
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+
+        try:
+            board, counts = import_records(boardfile.decode(stream, format), 
+                current_user.username)
+        except (ValueError, KeyError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            return error_page("Could not import %s: %s" % (upload.filename, e), 400)
+
+        db.session.commit()
 
-    if board.owner != current_user.username:
-        message = "Only the board creator can modify board details."
+        flash("Imported %s." % describe_counts(counts))
 
-        return render_template('error.html', message=message, name=current_user.username)
+        return redirect(url_for('view_board', board_id=board.public_id))
+
+    return render_template('board/import_board.html', form=form, name=current_user.username)
+
+@app.route('/<board_id>/update', methods=['GET', 'POST'])
+@login_required
+@board_access('owner', "Only the board creator can modify board details.")
+def update_board(board_id):
+    board = g.board
 
     form = BoardUpdateForm(
         title=board.title, 
@@ -237,8 +1214,11 @@ def update_board(board_id):
         if board.private != form.private.data:
             board.private = form.private.data
 
+        touch_board(board)
         db.session.commit()
 
+        announce(board_id, {'type': 'board_updated'})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('board/update_board.html', form=form, 
@@ -246,50 +1226,21 @@ def update_board(board_id):
 
 @app.route('/<board_id>/delete', methods=['GET', 'POST'])
 @login_required
+@board_access('owner', "Only the board creator can delete a board.")
 def delete_board(board_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-
-    if board.owner != current_user.username:
-        message = "Only the board creator can delete a board."
-
-        return render_template('error.html', message=message, name=current_user.username)
-
-    collabs = Collaborator.query.filter_by(board_id=board_id).all()
-    groups = Group.query.filter_by(board_id=board_id).all()
-    tickets = Ticket.query.filter_by(board_id=board_id).all()
-    comments = Comment.query.filter_by(board_id=board_id).all()
-    assignees = Assignee.query.filter_by(board_id=board_id).all()
+    board = g.board
 
     form = DeleteForm()  
 
     if form.validate_on_submit():
 
         if form.confirm.data == True:
-
-            db.session.delete(board)
-
-            if collabs != None:
-                for c in collabs:
-                    db.session.delete(c)
-
-            if groups != None:
-                for g in groups:
-                    db.session.delete(g)
-
-            if tickets != None:
-                for t in tickets:
-                    db.session.delete(t)
-
-            if comments != None:
-                for c in comments:
-                    db.session.delete(c)
-
-            if assignees != None:
-                for a in assignees:
-                    db.session.delete(a)
+            counts = delete_board_rows(board)
 
             db.session.commit()
 
+            flash("Deleted %s." % describe_counts(counts))
+
         return redirect(url_for('index'))
 
     return render_template('board/delete_board.html', form=form, 
@@ -297,25 +1248,16 @@ def delete_board(board_id):
 
 @app.route('/<board_id>/add_collab', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "Only the board creator or a collaborator can add collaborators.")
 def add_collab(board_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
-
-    if board.owner != current_user.username:
-
-        if collab == None:
-            message = "Only the board creator or a collaborator can add collaborators."
-
-            return render_template('error.html', message=message, name=current_user.username)
+    board = g.board
 
     form = CollaboratorForm()
 
     if form.validate_on_submit():
-        board = Board.query.filter_by(public_id=board_id).first()
-
         check_user_exists = User.query.filter_by(username=form.user.data).first()
         
-        check_if_collab = Collaborator.query.filter_by(board_id=board_id, 
+        check_if_collab = Collaborator.query.filter_by(board_id=board.id, 
             user_id=form.user.data).first()
         
         if board.owner == form.user.data:
@@ -328,14 +1270,16 @@ def add_collab(board_id):
 
         if check_if_collab != None:
             message = "User is already a collaborator."
-            return render_template('error.html', message=message)
+            return render_template('error.html', message=message, name=current_user.username)
 
-        new_collab = Collaborator(board_id=board_id, user_id=form.user.data, 
-            board_title=board.title)
+        new_collab = Collaborator(board_id=board.id, user_id=form.user.data)
 
         db.session.add(new_collab)
+        touch_board(board)
         db.session.commit()
 
+        announce(board_id, {'type': 'collaborator_added', 'user': form.user.data})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('collaborator/add_collab.html', form=form, 
@@ -343,19 +1287,13 @@ def add_collab(board_id):
 
 @app.route('/<board_id>/remove_collab/<username>', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "Only the board creator or a collaborator can update groups.")
 def remove_collab(board_id, username):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
+    collab = Collaborator.query.filter_by(board_id=board.id, user_id=username).first()
 
-    if board.owner != current_user.username:
-
-        if collab == None:
-            message = "Only the board creator or a collaborator can update groups."
-
-            return render_template('error.html', message=message, name=current_user.username)
-
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=username).first()
-    assignees = Assignee.query.filter_by(board_id=board_id).all()
+    if collab is None:
+        return error_page("Collaborator not found.", 404)
 
     form = DeleteForm()
 
@@ -363,14 +1301,25 @@ def remove_collab(board_id, username):
 
         if form.confirm.data == True:        
             db.session.delete(collab)
-            
-            if assignees != None:
-                
-                for a in assignees:
-                    db.session.delete(a)
 
+            # Tickets whose only assignee was this user become unassigned.
+            orphaned = db.session.query(Ticket.group_id).filter(Ticket.board_id == board.id, 
+                Ticket.assignees.any(Assignee.user_id == username), 
+                ~Ticket.assignees.any(Assignee.user_id != username))
+
+            progress = progress_delta()
+
+            for group_id, in orphaned:
+                progress[group_id]['unassigned_count'] += 1
+
+            Assignee.query.filter_by(board_id=board.id, user_id=username
+                ).delete(synchronize_session=False)
+
+            touch_board(board, progress)
             db.session.commit()
 
+            announce(board_id, {'type': 'collaborator_removed', 'user': username})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('collaborator/rem_collab.html', form=form, 
@@ -378,33 +1327,20 @@ def remove_collab(board_id, username):
 
 @app.route('/<board_id>/add_group', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to add a group.")
 def add_group(board_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collabs = Collaborator.query.filter_by(board_id=board_id).all()
-
-    check = False
-
-    if board.owner == current_user.username:
-        check = True
-
-    for c in collabs:
-        if c.user_id == current_user.username:
-            check = True
-
-    if check == False:
-        message = "User must be the board creator or a collaborator to add a group."
-
-        return render_template('error.html', message=message, name=current_user.username)
-
     form = GroupForm()
 
     if form.validate_on_submit():
-        new_group = Group(board_id=board_id, title=form.title.data, 
-            public_id=str(uuid.uuid4())[:7])
+        new_group = Group(board_id=g.board.id, title=form.title.data, 
+            public_id=new_public_id())
 
         db.session.add(new_group)
+        touch_board(g.board)
         db.session.commit()
 
+        announce(board_id, {'type': 'group_created', 'group': new_group.public_id})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('group/add_group.html', form=form, 
@@ -412,26 +1348,25 @@ def add_group(board_id):
 
 @app.route('/<board_id>/<group_id>', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to update groups.")
 def update_group(board_id, group_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.owner != current_user.username:
+    group = board_row(Group, group_id)
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to update groups."
-
-            return render_template('error.html', message=message, name=current_user.username)
-
-    group = Group.query.filter_by(public_id=group_id).first()
+    if group is None:
+        return error_page("Group not found.", 404)
 
     form = GroupForm(title=group.title)
 
     if form.validate_on_submit():
         group.title = form.title.data
 
+        touch_board(board)
         db.session.commit()
 
+        announce(board_id, {'type': 'group_renamed', 'group': group_id, 'title': group.title})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('group/update_group.html', form=form, 
@@ -439,43 +1374,33 @@ def update_group(board_id, group_id):
 
 @app.route('/<board_id>/<group_id>/delete', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to delete groups.")
 def delete_group(board_id, group_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
-
-    if board.owner != current_user.username:
-
-        if collab == None:
-            message = "User must be the board creator or a collaborator to delete groups."
+    board = g.board
 
-            return render_template('error.html', message=message, name=current_user.username)  
+    group = board_row(Group, group_id)
 
-    group = Group.query.filter_by(public_id=group_id).first()
-    tickets = Ticket.query.filter_by(group_id=group_id).all()
-    assignees = Assignee.query.filter_by(group_id=group_id).all()
-    comments = Comment.query.filter_by(group_id=group_id).all()
+    if group is None:
+        return error_page("Group not found.", 404)
 
     form = DeleteForm()
 
     if form.validate_on_submit():
         
         if form.confirm.data == True:
-        
-            db.session.delete(group)
+            counts = delete_group_rows(group)
 
-            if tickets != None:
-                for t in tickets:
-                    db.session.delete(t)
+            # The group's own counters go with it; take them off the board.
+            progress = progress_delta()
+            progress[group.id] = {column: -getattr(group, column) 
+                for column in migrations.PROGRESS_COLUMNS}
 
-            if assignees != None:
-                for a in assignees:
-                    db.session.delete(a)
+            touch_board(board, progress)
+            db.session.commit()
 
-            if comments != None:
-                for c in comments:
-                    db.session.delete(c)
+            announce(board_id, {'type': 'group_deleted', 'group': group_id})
 
-            db.session.commit()
+            flash("Deleted %s." % describe_counts(counts))
 
         return redirect(url_for('view_board', board_id=board_id))
 
@@ -484,28 +1409,35 @@ def delete_group(board_id, group_id):
 
 @app.route('/<board_id>/<group_id>/add_ticket', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to create tickets.")
 def create_ticket(board_id, group_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.owner != current_user.username:
+    group = board_row(Group, group_id)
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to create tickets."
-
-            return render_template('error.html', message=message, name=current_user.username)  
-
-    group = Group.query.filter_by(public_id=group_id).first()
+    if group is None:
+        return error_page("Group not found.", 404)
 
     form = TicketForm()
 
     if form.validate_on_submit():
-        new_ticket = Ticket(public_id=str(uuid.uuid4())[:7], group_id=group_id, 
-            board_id=board_id, text=form.text.data, status="")
+        new_ticket = Ticket(public_id=new_public_id(), group_id=group.id, 
+            board_id=board.id, text=form.text.data, status="")
 
         db.session.add(new_ticket)
+
+        change = {'type': 'ticket_created', 'group': group_id, 'ticket': new_ticket.public_id, 
+            'html': render_template('board/ticket.html', board=board, group=group, 
+                ticket=new_ticket)}
+
+        progress = progress_delta()
+        add_progress(progress, group.id, new_ticket.status, False)
+
+        touch_board(board, progress)
         db.session.commit()
 
+        announce(board_id, change)
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('ticket/create_ticket.html', form=form, board=board, 
@@ -513,23 +1445,23 @@ def create_ticket(board_id, group_id):
 
 @app.route('/<board_id>/<group_id>/<ticket_id>/update', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to update tickets.")
 def update_ticket(board_id, group_id, ticket_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.owner != current_user.username:
-
-        if collab == None:
-            message = "User must be the board creator or a collaborator to update tickets."
-
-            return render_template('error.html', message=message, name=current_user.username)
+    ticket = board_row(Ticket, ticket_id)
+    group = board_row(Group, group_id)
 
-    ticket = Ticket.query.filter_by(public_id=ticket_id).first()
-    group = Group.query.filter_by(public_id=group_id).first()
+    if ticket is None or group is None:
+        return error_page("Ticket not found.", 404)
 
     form = TicketUpdateForm(text=ticket.text, status=ticket.status)
 
     if form.validate_on_submit():
+        old_status = ticket.status
+
+        # Whether the ticket had assignees only matters when adding one.
+        assigned = True
 
         if form.text.data != "":
             ticket.text = form.text.data
@@ -537,10 +1469,14 @@ def update_ticket(board_id, group_id, ticket_id):
         if form.status.data != "":
             ticket.status = form.status.data
 
+        changes = [{'type': 'ticket_updated', 'ticket': ticket_id, 
+            'text': ticket.text, 'status': ticket.status}]
+
         if form.assign.data != "":
 
-            collab = Collaborator.query.filter_by(board_id=board_id, user_id=form.assign.data).first()
-            assignee = Assignee.query.filter_by(user_id=form.assign.data, ticket_id=ticket_id).first()
+            collab = Collaborator.query.filter_by(board_id=board.id, user_id=form.assign.data).first()
+            assignees = ticket.assignees
+            assigned = bool(assignees)
 
             check = False
 
@@ -550,7 +1486,7 @@ def update_ticket(board_id, group_id, ticket_id):
             if collab != None:
                 check = True
 
-            if assignee != None:
+            if any(a.user_id == form.assign.data for a in assignees):
                 message = "User is already assigned to this ticket."
                 return render_template('error.html', message=message, name=current_user.username)
 
@@ -559,12 +1495,27 @@ def update_ticket(board_id, group_id, ticket_id):
                 return render_template('error.html', message=message, name=current_user.username)
 
             new_assignee = Assignee(user_id=form.assign.data, 
-                    ticket_id=ticket_id, board_id=board_id)
+                    ticket_id=ticket.id, board_id=board.id, status=ticket.status)
 
             db.session.add(new_assignee) 
 
+            changes.append({'type': 'assignee_added', 'ticket': ticket_id, 'user': form.assign.data, 
+                'html': render_template('board/assignee.html', board=board, 
+                    ticket=ticket, assignee=new_assignee)})
+
+        if ticket.status != old_status:
+            Assignee.query.filter_by(ticket_id=ticket.id).update(
+                {Assignee.status: ticket.status}, synchronize_session=False)
+
+        progress = progress_delta()
+        add_progress(progress, ticket.group_id, old_status, assigned, -1)
+        add_progress(progress, ticket.group_id, ticket.status, True)
+
+        touch_board(board, progress)
         db.session.commit()
 
+        announce(board_id, *changes)
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('ticket/update_ticket.html', form=form, 
@@ -572,41 +1523,34 @@ def update_ticket(board_id, group_id, ticket_id):
 
 @app.route('/<board_id>/<group_id>/<ticket_id>/delete', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to delete tickets.")
 def delete_ticket(board_id, group_id, ticket_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.owner != current_user.username:
+    ticket = board_row(Ticket, ticket_id)
+    group = board_row(Group, group_id)
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to delete tickets."
-
-            return render_template('error.html', message=message, name=current_user.username)
-
-    ticket = Ticket.query.filter_by(public_id=ticket_id).first()
-    assignees = Assignee.query.filter_by(ticket_id=ticket_id).all()
-    comments = Comment.query.filter_by(ticket_id=ticket_id).all()
-    group = Group.query.filter_by(public_id=group_id).first()
+    if ticket is None or group is None:
+        return error_page("Ticket not found.", 404)
 
     form = DeleteForm() 
 
     if form.validate_on_submit():
 
         if form.confirm.data == True:
+            counts = delete_tickets(Ticket.id == ticket.id)
 
-            db.session.delete(ticket)
+            progress = progress_delta()
 
-            if assignees != None:
+            if counts['tickets']:
+                add_progress(progress, ticket.group_id, ticket.status, counts['assignees'] > 0, -1)
 
-                for a in assignees:
-                    db.session.delete(a)
-
-            if comments != None:
+            touch_board(board, progress)
+            db.session.commit()
 
-                for c in comments:
-                    db.session.delete(c)
+            announce(board_id, {'type': 'ticket_deleted', 'ticket': ticket_id})
 
-            db.session.commit()
+            flash("Deleted %s." % describe_counts(counts))
 
         return redirect(url_for('view_board', board_id=board_id))
 
@@ -614,20 +1558,112 @@ def delete_ticket(board_id, group_id, ticket_id):
         name=current_user.username, group=group)
 
 
-@app.route('/<board_id>/<ticket_id>/<user_id>', methods=['GET', 'POST'])
+@app.route('/<board_id>/bulk_tickets', methods=['POST'])
 @login_required
-def remove_assignee(board_id, ticket_id, user_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+@board_access('member', "User must be the board creator or a collaborator to update tickets.")
+def bulk_update_tickets(board_id):
+    board = g.board
 
-    if board.owner != current_user.username:
+    form = BulkTicketForm()
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to remove assignees."
+    if not form.validate_on_submit():
+        return error_page("Invalid bulk ticket update.", 400)
 
-            return render_template('error.html', message=message, name=current_user.username)
+    tickets = Ticket.query.filter(Ticket.board_id == board.id, 
+        Ticket.public_id.in_(form.tickets.data)).all()
+
+    if not tickets:
+        flash("No tickets selected.")
+
+        return redirect(url_for('view_board', board_id=board_id))
+
+    ticket_ids = [t.id for t in tickets]
+    status = form.status.data
+    assign = form.assign.data.strip()
+    target = None
+
+    if form.group.data:
+        target = Group.query.filter_by(board_id=board.id, public_id=form.group.data).first()
+
+        if target is None:
+            return error_page("Group not found.", 404)
+
+    # Validate the assignee once for the whole batch rather than per ticket.
+    if assign and board.owner != assign and Collaborator.query.filter_by(
+            board_id=board.id, user_id=assign).first() is None:
+        message = "User must be the board creator or a collaborator be be assigned to ticket."
+        return error_page(message)
+
+    # One lookup serves the duplicate check and the unassigned counters.
+    assignments = db.session.query(Assignee.ticket_id, Assignee.user_id).filter(
+        Assignee.ticket_id.in_(ticket_ids)).all()
+    assigned = {ticket_id for ticket_id, user_id in assignments}
+    already = {ticket_id for ticket_id, user_id in assignments if user_id == assign}
+    assign_to = [t for t in tickets if t.id not in already] if assign else []
+
+    progress = progress_delta()
+
+    for t in tickets:
+        add_progress(progress, t.group_id, t.status, t.id in assigned, -1)
+        add_progress(progress, target.id if target is not None else t.group_id, 
+            status or t.status, t.id in assigned or bool(assign))
+
+    values = {}
+
+    if status:
+        values[Ticket.status] = status
+
+    if target is not None:
+        values[Ticket.group_id] = target.id
+
+    if values:
+        Ticket.query.filter(Ticket.id.in_(ticket_ids)).update(values, 
+            synchronize_session=False)
+
+    if status:
+        Assignee.query.filter(Assignee.ticket_id.in_(ticket_ids)).update(
+            {Assignee.status: status}, synchronize_session=False)
+
+    db.session.bulk_insert_mappings(Assignee, [{'user_id': assign, 'ticket_id': t.id, 
+        'board_id': board.id, 'status': status or t.status} for t in assign_to])
+
+    if target is None:
+        changes = []
+
+        if status:
+            changes += [{'type': 'ticket_updated', 'ticket': t.public_id, 'text': t.text, 
+                'status': status} for t in tickets]
+
+        changes += [{'type': 'assignee_added', 'ticket': t.public_id, 'user': assign, 
+            'html': render_template('board/assignee.html', board=board, ticket=t, 
+                assignee={'user_id': assign})} for t in assign_to]
 
-    ticket = Ticket.query.filter_by(public_id=ticket_id).first()
+    touch_board(board, progress)
+    db.session.commit()
+
+    if target is not None:
+        # Moved rows carry new links, so ship them re-rendered in full.
+        changes = [{'type': 'ticket_moved', 'ticket': t.public_id, 'group': target.public_id, 
+            'html': render_template('board/ticket.html', board=board, group=target, ticket=t)} 
+            for t in Ticket.query.filter(Ticket.id.in_(ticket_ids)).options(
+                selectinload(Ticket.assignees))]
+
+    announce(board_id, *changes)
+
+    flash("Updated %d tickets." % len(tickets))
+
+    return redirect(url_for('view_board', board_id=board_id))
+
+@app.route('/<board_id>/<ticket_id>/<user_id>', methods=['GET', 'POST'])
+@login_required
+@board_access('member', "User must be the board creator or a collaborator to remove assignees.")
+def remove_assignee(board_id, ticket_id, user_id):
+    board = g.board
+
+    ticket = board_row(Ticket, ticket_id)
+
+    if ticket is None:
+        return error_page("Ticket not found.", 404)
 
     form = DeleteForm()
 
@@ -635,11 +1671,23 @@ def remove_assignee(board_id, ticket_id, user_id):
 
         if form.confirm.data == True:
 
-            assignee = Assignee.query.filter_by(user_id=user_id, ticket_id=ticket_id).first()
+            assignees = ticket.assignees
+            assignee = next((a for a in assignees if a.user_id == user_id), None)
+
+            if assignee is None:
+                return error_page("User is not assigned to this ticket.", 404)
+
+            progress = progress_delta()
+
+            if len(assignees) == 1:
+                progress[ticket.group_id]['unassigned_count'] += 1
 
             db.session.delete(assignee)
+            touch_board(board, progress)
             db.session.commit()
 
+            announce(board_id, {'type': 'assignee_removed', 'ticket': ticket_id, 'user': user_id})
+
         return redirect(url_for('view_board', board_id=board_id))
 
     return render_template('collaborator/rem_assignee.html', form=form, 
@@ -647,18 +1695,14 @@ def remove_assignee(board_id, ticket_id, user_id):
 
 @app.route('/<board_id>/<ticket_id>/comment', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to create comments.")
 def create_comment(board_id, ticket_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
-
-    if board.owner != current_user.username:
+    board = g.board
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to create comments."
+    ticket = board_row(Ticket, ticket_id)
 
-            return render_template('error.html', message=message, name=current_user.username)
-
-    ticket = Ticket.query.filter_by(public_id=ticket_id).first()
+    if ticket is None:
+        return error_page("Ticket not found.", 404)
 
     form = CommentForm()
 
@@ -669,13 +1713,16 @@ def create_comment(board_id, ticket_id):
             
             return render_template('error.html', message=message, name=current_user.username)
 
-        now = datetime.now()
-        timestamp = now.strftime("%d/%m/%Y %H:%M:%S")
-
-        comment = Comment(user_id=current_user.username, ticket_id=ticket_id, 
-            text=form.text.data, timestamp=timestamp, public_id=str(uuid.uuid4())[:7])
+        comment = Comment(user_id=current_user.username, ticket_id=ticket.id, board_id=board.id, 
+            text=form.text.data, created_at=datetime.now(), public_id=new_public_id())
 
         db.session.add(comment)
+
+        # A comment counts as board activity even though the board page 
+        # does not show it, so the version stays as it is.
+        Board.query.filter_by(id=board.id).update(
+            {Board.updated_at: datetime.now()}, synchronize_session=False)
+
         db.session.commit()
 
         return redirect(url_for('view_comments', board_id=board_id, ticket_id=ticket_id))
@@ -685,39 +1732,53 @@ def create_comment(board_id, ticket_id):
 
 @app.route('/<board_id>/<ticket_id>/comments', methods=['GET', 'POST'])
 @login_required
+@board_access('view', "Board is private. Must be the board creator or a collaborator to view this board.")
 def view_comments(board_id, ticket_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.private == "Private":
+    ticket = board_row(Ticket, ticket_id)
 
-        if board.owner != current_user.username:
+    if ticket is None:
+        return error_page("Ticket not found.", 404)
 
-            if collab == None:
-                message = "Board is private. Must be the board creator or a collaborator to view this board."
+    # Newest first, one page at a time. The cursor is the (created_at, id) of
+    # the last comment shown, which the (ticket_id, created_at, id) index can 
+    # seek to directly however deep the thread goes.
+    query = ticket.comments
 
-                return render_template('error.html', message=message, name=current_user.username)
+    if 'before' in request.args:
+        try:
+            before = datetime.fromisoformat(request.args['before'])
+            before_id = int(request.args.get('before_id', 0))
+        except ValueError:
+            return error_page("Invalid comment cursor.", 400)
+
+        query = query.filter(or_(Comment.created_at < before, 
+            and_(Comment.created_at == before, Comment.id < before_id)))
+
+    comments = query.order_by(Comment.created_at.desc(), Comment.id.desc()
+        ).limit(COMMENTS_PER_PAGE + 1).all()
 
-    ticket = Ticket.query.filter_by(public_id=ticket_id).first()
-    comments = Comment.query.filter_by(ticket_id=ticket_id).all()
+    older = None
+
+    if len(comments) > COMMENTS_PER_PAGE:
+        comments = comments[:COMMENTS_PER_PAGE]
+        older = url_for('view_comments', board_id=board_id, ticket_id=ticket_id, 
+            before=comments[-1].created_at.isoformat(), before_id=comments[-1].id)
 
     return render_template('comment/view_comments.html', board=board, 
-        name=current_user.username, comments=comments, ticket=ticket)
+        name=current_user.username, comments=comments, ticket=ticket, older=older)
 
 @app.route('/<board_id>/<ticket_id>/<comment_id>/update_comment', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to edit comments.")
 def update_comment(board_id, ticket_id, comment_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
-
-    if board.owner != current_user.username:
-
-        if collab == None:
-            message = "User must be the board creator or a collaborator to edit comments."
+    board = g.board
 
-            return render_template('error.html', message=message, name=current_user.username)
+    comment = board_row(Comment, comment_id)
 
-    comment = Comment.query.filter_by(public_id=comment_id).first()
+    if comment is None:
+        return error_page("Comment not found.", 404)
 
     form = CommentForm(text=comment.text)
 
@@ -733,25 +1794,20 @@ def update_comment(board_id, ticket_id, comment_id):
 
 @app.route('/<board_id>/<ticket_id>/<comment_id>/delete_comment', methods=['GET', 'POST'])
 @login_required
+@board_access('member', "User must be the board creator or a collaborator to delete comments.")
 def delete_comment(board_id, ticket_id, comment_id):
-    board = Board.query.filter_by(public_id=board_id).first()
-    collab = Collaborator.query.filter_by(board_id=board_id, user_id=current_user.username).first()
+    board = g.board
 
-    if board.owner != current_user.username:
+    comment = board_row(Comment, comment_id)
 
-        if collab == None:
-            message = "User must be the board creator or a collaborator to delete comments."
-            
-            return render_template('error.html', message=message, name=current_user.username)
+    if comment is None:
+        return error_page("Comment not found.", 404)
     
     form = DeleteForm()
 
     if form.validate_on_submit():
 
         if form.confirm.data == True:
-        
-            comment = Comment.query.filter_by(public_id=comment_id).first()
-
             db.session.delete(comment)
             db.session.commit()
 
@@ -761,5 +1817,57 @@ def delete_comment(board_id, ticket_id, comment_id):
         board=board, name=current_user.username)
 
 
+SETUP_FINISHED = time.perf_counter()
+
+
+def create_app():
+    """Entry point for `gunicorn --preload 'app:create_app()'`.
+
+    Does the slow first-request work once in the master so every worker
+    forks with it done: static assets are rebuilt if any source changed 
+    since the last build, all templates are compiled (or read back from 
+    the bytecode cache) and a few pages render once. Pooled database
+    connections are then closed so no worker shares a socket with another.
+    Prints how long import, app setup and each warm-up step took.
+    """
+    times = {
+        'import modules': SETUP_STARTED - IMPORT_STARTED,
+        'create app': SETUP_FINISHED - SETUP_STARTED,
+    }
+
+    if static_assets.stale:
+        started = time.perf_counter()
+        static_assets.build()
+        times['build assets'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    names = startup.compile_templates(app)
+    times['compile %d templates' % len(names)] = time.perf_counter() - started
+
+    for path, seconds in startup.render_pages(app, WARM_UP_PATHS).items():
+        times['first render ' + path] = seconds
+
+    with app.app_context():
+        db.engine.dispose()
+
+    for engine in read_replicas.engines:
+        engine.dispose()
+
+    app.config['STARTUP_TIMES'] = times
+    print('Startup times:\n  ' + '\n  '.join(startup.report(times)), file=sys.stderr, flush=True)
+
+    return app
+
+
+@app.cli.command('startup-report')
+def startup_report():
+    """Warm the app up as gunicorn would and print where the time went."""
+    create_app()
+
+
 if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade(db.engine)
+
     app.run()
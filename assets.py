@@ -0,0 +1,260 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ONE_YEAR = 365 * 24 * 60 * 60
+MANIFEST = 'manifest.json'
+VENDOR = 'vendor/'
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.eot', '.ttf'}
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def source_files(sources, skip):
+    """Logical name -> path for every file under the (prefix, directory) sources."""
+    files = {}
+
+    for prefix, directory in sources:
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != skip]
+
+            for name in names:
+                if name.endswith('.map'):
+                    continue
+
+                path = os.path.join(root, name)
+                files[prefix + os.path.relpath(path, directory).replace(os.sep, '/')] = path
+
+    return files
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def rewrite_css(name, css, hashed):
+    """Point url() references in a stylesheet at the hashed names."""
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, ref = match.groups()
+        path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+
+        if not path or path.startswith('/') or ':' in path:
+            return match.group(0)
+
+        target = posixpath.normpath(posixpath.join(base, path))
+
+        if target not in hashed:
+            return match.group(0)
+
+        return 'url(%s%s%s%s)' % (quote, posixpath.relpath(hashed[target], base or '.'), suffix, quote)
+
+    return CSS_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def compressed(data):
+    """Encoding -> bytes for each encoding that makes data smaller, best first."""
+    variants = {}
+
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+
+    variants['gzip'] = gzip.compress(data, 9, mtime=0)
+
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def build(sources, output):
+    """Copy sources into output under content-hashed names, precompressed.
+
+    sources is a list of (name prefix, directory). Stylesheets are written
+    last so their url() references can point at the other files' hashed
+    names. Returns the manifest that is also written to output, which
+    records each source's digest so a later change to it can be spotted.
+    """
+    files = source_files(sources, skip=os.path.abspath(output))
+    ordered = sorted(files, key=lambda name: (name.endswith('.css'), name))
+    hashed, encodings, digests = {}, {}, {}
+
+    shutil.rmtree(output, ignore_errors=True)
+
+    for name in ordered:
+        with open(files[name], 'rb') as f:
+            data = f.read()
+
+        digests[name] = hashlib.sha256(data).hexdigest()
+
+        if name.endswith('.css'):
+            data = rewrite_css(name, data, hashed)
+
+        root, ext = posixpath.splitext(name)
+        hashed[name] = '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+        path = os.path.join(output, *hashed[name].split('/'))
+        variants = compressed(data) if ext in COMPRESSIBLE else {}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        for encoding, body in variants.items():
+            with open(path + SUFFIXES[encoding], 'wb') as f:
+                f.write(body)
+
+        encodings[hashed[name]] = list(variants)
+
+    manifest = {'files': hashed, 'encodings': encodings, 'sources': digests}
+
+    with open(os.path.join(output, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return manifest
+
+
+class Assets:
+    """Serves static files under content-hashed names.
+
+    build() copies the static folder, plus the Bootstrap, jQuery and fonts
+    bundled with Flask-Bootstrap, into directory. Once built,
+    url_for('static', ...) gives the hashed name, which is served from the
+    build with the best precompressed variant the browser accepts and
+    cached for a year. Files that are not in the build are served from the
+    static folder as before, and Bootstrap comes from Flask-Bootstrap's
+    local copy rather than its CDN. So are files whose source changed since
+    the build, listed in stale, until the next build.
+
+    HTML responses of compress_min_bytes or more are gzipped on the way out.
+    """
+
+    def __init__(self, app=None, directory=None, compress_min_bytes=1024, compress_level=6):
+        self.directory = directory
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+        self.files = {}
+        self.encodings = {}
+        self.digests = {}
+        self.stale = set()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = self.directory or os.path.join(app.static_folder, 'dist')
+        self.sources = [('', app.static_folder),
+            (VENDOR, os.path.join(app.blueprints['bootstrap'].root_path, 'static'))]
+        self.load()
+
+        app.url_defaults(self.hashed_name)
+        app.view_functions['static'] = self.send
+        app.jinja_env.globals['bootstrap_find_resource'] = self.bootstrap_resource
+        app.after_request(self.compress)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'files': {}, 'encodings': {}}
+
+        self.files = manifest['files']
+        self.encodings = manifest['encodings']
+        self.digests = {name: file_digest(path) for name, path in 
+            source_files(self.sources, skip=os.path.abspath(self.directory)).items()}
+        self.stale = self.check(manifest.get('sources', {}))
+
+        if self.stale:
+            # A stylesheet may point at a stale file's old hashed name, so
+            # they go back to the static folder too.
+            for name in self.stale | {name for name in self.files if name.endswith('.css')}:
+                self.files.pop(name, None)
+
+    def check(self, digests):
+        """Names whose source is new, gone or different from the build's."""
+        return {name for name in set(self.digests) | set(digests) 
+            if self.digests.get(name) != digests.get(name)}
+
+    @property
+    def release(self):
+        """Digest of every static source, which the hashed names follow."""
+        return hashlib.sha256(json.dumps(self.digests, sort_keys=True).encode()).hexdigest()
+
+    def build(self):
+        manifest = build(self.sources, self.directory)
+        self.load()
+
+        return manifest
+
+    def hashed_name(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.files:
+            values['filename'] = self.files[values['filename']]
+
+    def bootstrap_resource(self, filename, cdn, use_minified=None, local=True):
+        """Stands in for Flask-Bootstrap's helper so pages never use its CDN."""
+        if use_minified is None:
+            use_minified = current_app.config['BOOTSTRAP_USE_MINIFIED']
+
+        if use_minified:
+            filename = '%s.min.%s' % tuple(filename.rsplit('.', 1))
+
+        if VENDOR + filename in self.files:
+            return url_for('static', filename=VENDOR + filename)
+
+        return url_for('bootstrap.static', filename=filename)
+
+    def send(self, filename):
+        if filename not in self.encodings:
+            return current_app.send_static_file(filename)
+
+        variants = self.encodings[filename]
+        encoding = next((e for e in variants if request.accept_encodings[e]), None)
+        path = filename + SUFFIXES[encoding] if encoding else filename
+
+        response = send_from_directory(self.directory, path, max_age=ONE_YEAR,
+            download_name=posixpath.basename(filename), mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.cache_control.immutable = True
+
+        if variants:
+            response.vary.add('Accept-Encoding')
+
+        if encoding:
+            response.content_encoding = encoding
+
+        return response
+
+    def compress(self, response):
+        if response.mimetype != 'text/html' or response.status_code != 200 \
+                or response.direct_passthrough or response.is_streamed or response.content_encoding:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        data = response.get_data()
+
+        if not request.accept_encodings['gzip'] or len(data) < self.compress_min_bytes:
+            return response
+
+        response.set_data(gzip.compress(data, self.compress_level))
+        response.content_encoding = 'gzip'
+
+        return response
+
+
+def from_environ(environ):
+    return Assets(directory=environ.get('ASSETS_DIR'),
+        compress_min_bytes=int(environ.get('COMPRESS_MIN_BYTES', 1024)),
+        compress_level=int(environ.get('COMPRESS_LEVEL', 6)))
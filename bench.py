@@ -0,0 +1,429 @@
+"""Route benchmarks for the progress tracker.
+
+Seeds a synthetic board of the requested size, drives every route through
+the Flask test client, and reports p50/p95 latency, SQL statements and peak
+Python memory per route. A route that issues more statements than its
+budget fails the run, so query-count regressions show up before deploy, and
+so does a route that is neither benchmarked nor listed in NOT_BENCHMARKED.
+Routes that delete something work through rows seeded for them on a
+separate scratch board, one per request.
+
+    python bench.py                          # SQLite in a temp file
+    python bench.py --groups 40 --tickets 3000
+    python bench.py --database-url postgresql://localhost/tracker_bench
+
+The target database is created from scratch and should be disposable.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+
+# Statements each request may issue. Keep these tight: raising one should be
+# a deliberate decision made in review.
+QUERY_BUDGETS = {
+    'index': 1,
+    'faq': 0,
+    'login': 2,
+    'profile': 0,
+    'user profile': 1,
+    'view_board (cold cache)': 3,
+    'view_board': 1,
+    'group tickets (cold cache)': 3,
+    'group tickets': 1,
+    'board json': 4,
+    'board json (304)': 1,
+    'view_comments': 3,
+    'search': 3,
+    'my tickets': 1,
+    'my tickets json': 1,
+    'update_board form': 1,
+    'add_collab form': 1,
+    'update_group form': 2,
+    'create_ticket form': 2,
+    'update_ticket form': 3,
+    'delete_ticket form': 3,
+    'delete_group form': 2,
+    'create_comment form': 2,
+    'create_ticket': 7,
+    'update_ticket': 9,
+    'bulk status': 9,
+    'create_comment': 4,
+    'login form': 0,
+    'signup form': 0,
+    'search page': 3,
+    'cache stats': 0,
+    'metrics': 0,
+    'board events': 1,
+    'export jsonl': 6,
+    'export csv': 6,
+    'import form': 0,
+    'create_board form': 0,
+    'delete_board form': 1,
+    'add_group form': 1,
+    'edit_profile form': 0,
+    'remove_collab form': 2,
+    'remove_assignee form': 2,
+    'update_comment form': 2,
+    'delete_comment form': 2,
+    'signup': 1,
+    'edit_profile': 2,
+    'create_board': 2,
+    'update_board': 3,
+    'add_group': 5,
+    'update_group': 5,
+    'add_collab': 6,
+    'remove_collab': 7,
+    'update_comment': 3,
+    'import': 11,
+    'delete_comment': 3,
+    'delete_ticket': 10,
+    'remove_assignee': 8,
+    'delete_group': 8,
+    'delete_board': 7,
+}
+
+# (endpoint, method) pairs left out on purpose, with the reason.
+NOT_BENCHMARKED = {
+    ('static', 'GET'): 'serves files without touching the database',
+    ('bootstrap.static', 'GET'): 'serves files without touching the database',
+    ('logout', 'GET'): 'would end the session the other routes run in',
+    ('view_profile', 'POST'): 'renders the same page as GET',
+    ('view_comments', 'POST'): 'renders the same page as GET',
+}
+
+
+def new_id():
+    # Longer than the app's 7 characters so large boards do not collide.
+    return uuid.uuid4().hex[:12]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', help='Database to seed and benchmark (default: temporary SQLite file).')
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--tickets', type=int, default=500, help='Tickets per board, spread over the groups.')
+    parser.add_argument('--assignees', type=int, default=2, help='Assignees per ticket.')
+    parser.add_argument('--comments', type=int, default=200, help='Comments on the benchmarked ticket.')
+    parser.add_argument('--collaborators', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=30, help='Requests per route.')
+
+    return parser.parse_args(argv)
+
+
+def seed(m, args):
+    """Insert one board of the requested size with bulk inserts. Returns ids."""
+    owner = 'benchowner'
+    collaborators = ['bench%02d' % i for i in range(args.collaborators)]
+    # Added and removed as collaborators, one per request.
+    extras = ['benchx%03d' % i for i in range(args.requests + 1)]
+    pwhash = m.hasher.hash('benchpassword')
+
+    m.db.session.bulk_insert_mappings(m.User, [{'username': name, 'email': '%s@example.com' % name,
+        'password': pwhash} for name in [owner] + collaborators + extras])
+
+    # A fresh database, so rows can be given their ids up front and children
+    # inserted in bulk without reading them back.
+    board_id = new_id()
+    m.db.session.bulk_insert_mappings(m.Board, [{'id': 1, 'public_id': board_id, 'title': 'Benchmark board',
+        'owner': owner, 'private': 'Private', 'description': 'Synthetic data', 'version': 0}])
+    m.db.session.bulk_insert_mappings(m.Collaborator, [{'board_id': 1, 'user_id': name}
+        for name in collaborators])
+
+    groups = [{'id': i + 1, 'board_id': 1, 'public_id': new_id(), 'title': 'Group %d' % i}
+        for i in range(args.groups)]
+    m.db.session.bulk_insert_mappings(m.Group, groups)
+
+    statuses = ['', 'Working On It', 'Completed']
+    tickets = [{'id': i + 1, 'board_id': 1, 'group_id': groups[i % len(groups)]['id'], 'public_id': new_id(),
+        'text': 'Ticket %d' % i, 'status': statuses[i % 3]} for i in range(args.tickets)]
+    m.db.session.bulk_insert_mappings(m.Ticket, tickets)
+
+    people = [owner] + collaborators
+    m.db.session.bulk_insert_mappings(m.Assignee, [{'board_id': 1, 'ticket_id': t['id'],
+        'user_id': people[(i + k) % len(people)], 'status': t['status']}
+        for i, t in enumerate(tickets) for k in range(min(args.assignees, len(people)))])
+
+    ticket = tickets[0]
+    m.db.session.bulk_insert_mappings(m.Comment, [{'ticket_id': ticket['id'], 'board_id': 1,
+        'user_id': people[i % len(people)], 'text': 'Comment %d' % i, 'public_id': new_id(),
+        'created_at': m.datetime(2020, 1, 1, 12, i // 60 % 60, i % 60)} for i in range(args.comments)])
+
+    ids = {'owner': owner, 'collaborator': collaborators[0] if collaborators else owner,
+        'board': board_id, 'group': groups[0]['public_id'], 'ticket': ticket['public_id'],
+        'tickets': [t['public_id'] for t in tickets[:50]], 'extras': extras,
+        'comment': m.Comment.query.filter_by(ticket_id=ticket['id']).first().public_id}
+    ids.update(seed_scratch(m, args, owner, len(groups), len(tickets)))
+
+    m.migrations.rebuild_progress(m.db.session.connection())
+    m.db.session.commit()
+
+    return ids
+
+
+def seed_scratch(m, args, owner, group_count, ticket_count):
+    """Rows for the routes that delete things, one per request, on a second
+    board so the benchmarked board keeps its size. Returns their ids."""
+    n = args.requests + 1
+    scratch = new_id()
+    m.db.session.bulk_insert_mappings(m.Board, [{'id': 2, 'public_id': scratch, 'title': 'Scratch board',
+        'owner': owner, 'private': 'Private', 'description': 'Deleted piece by piece', 'version': 0}])
+
+    groups = [{'id': group_count + 1 + i, 'board_id': 2, 'public_id': new_id(), 'title': 'Scratch %d' % i}
+        for i in range(n + 1)]
+    m.db.session.bulk_insert_mappings(m.Group, groups)
+
+    # The first group holds the tickets; the rest are deleted whole.
+    tickets = [{'id': ticket_count + 1 + i, 'board_id': 2, 'group_id': groups[0]['id'], 'public_id': new_id(),
+        'text': 'Scratch %d' % i, 'status': ''} for i in range(2 * n + 1)]
+    m.db.session.bulk_insert_mappings(m.Ticket, tickets)
+
+    assigned = tickets[n:2 * n]
+    m.db.session.bulk_insert_mappings(m.Assignee, [{'board_id': 2, 'ticket_id': t['id'], 'user_id': owner,
+        'status': ''} for t in assigned])
+
+    discussed = tickets[-1]
+    comments = [{'ticket_id': discussed['id'], 'board_id': 2, 'user_id': owner, 'text': 'Scratch %d' % i,
+        'public_id': new_id(), 'created_at': m.datetime(2020, 1, 1)} for i in range(n)]
+    m.db.session.bulk_insert_mappings(m.Comment, comments)
+
+    boards = [{'id': 3 + i, 'public_id': new_id(), 'title': 'Doomed %d' % i, 'owner': owner,
+        'private': 'Private', 'version': 0} for i in range(n)]
+    m.db.session.bulk_insert_mappings(m.Board, boards)
+
+    return {'scratch': scratch, 'scratch_group': groups[0]['public_id'],
+        'scratch_groups': [g['public_id'] for g in groups[1:]],
+        'scratch_tickets': [t['public_id'] for t in tickets[:n]],
+        'assigned_tickets': [t['public_id'] for t in assigned],
+        'discussed_ticket': discussed['public_id'], 'scratch_comments': [c['public_id'] for c in comments],
+        'scratch_boards': [b['public_id'] for b in boards]}
+
+
+def routes(ids):
+    """(name, method, path, form data) for every benchmarked request. A path
+    or form data may instead be a function of the request number."""
+    b, gr, t, cm = ids['board'], ids['group'], ids['ticket'], ids['comment']
+    sb, sg, st = ids['scratch'], ids['scratch_group'], ids['discussed_ticket']
+    confirm = {'confirm': 'y'}
+
+    return [
+        ('index', 'GET', '/', None),
+        ('faq', 'GET', '/faq', None),
+        ('profile', 'GET', '/profile', None),
+        ('user profile', 'GET', '/profile/%s' % ids['collaborator'], None),
+        ('view_board (cold cache)', 'GET', '/%s' % b, None),
+        ('view_board', 'GET', '/%s' % b, None),
+        ('group tickets (cold cache)', 'GET', '/%s/groups/%s/tickets' % (b, gr), None),
+        ('group tickets', 'GET', '/%s/groups/%s/tickets' % (b, gr), None),
+        ('board json', 'GET', '/api/boards/%s' % b, None),
+        ('board json (304)', 'GET', '/api/boards/%s' % b, None),
+        ('view_comments', 'GET', '/%s/%s/comments' % (b, t), None),
+        ('search', 'GET', '/api/search?q=ticket', None),
+        ('my tickets', 'GET', '/my-tickets', None),
+        ('my tickets json', 'GET', '/api/my-tickets?status=working', None),
+        ('update_board form', 'GET', '/%s/update' % b, None),
+        ('add_collab form', 'GET', '/%s/add_collab' % b, None),
+        ('update_group form', 'GET', '/%s/%s' % (b, gr), None),
+        ('create_ticket form', 'GET', '/%s/%s/add_ticket' % (b, gr), None),
+        ('update_ticket form', 'GET', '/%s/%s/%s/update' % (b, gr, t), None),
+        ('delete_ticket form', 'GET', '/%s/%s/%s/delete' % (b, gr, t), None),
+        ('delete_group form', 'GET', '/%s/%s/delete' % (b, gr), None),
+        ('create_comment form', 'GET', '/%s/%s/comment' % (b, t), None),
+        ('create_ticket', 'POST', '/%s/%s/add_ticket' % (b, gr), {'text': 'Benchmark ticket'}),
+        ('update_ticket', 'POST', '/%s/%s/%s/update' % (b, gr, t),
+            {'text': 'Updated', 'status': 'Working On It', 'assign': ''}),
+        ('bulk status', 'POST', '/%s/bulk_tickets' % b,
+            {'tickets': ids['tickets'], 'status': 'Completed', 'assign': '', 'group': ''}),
+        ('create_comment', 'POST', '/%s/%s/comment' % (b, t), {'text': 'Benchmark comment'}),
+        ('login form', 'GET', '/login', None),
+        ('signup form', 'GET', '/signup', None),
+        ('search page', 'GET', '/search?q=ticket', None),
+        ('cache stats', 'GET', '/cache-stats', None),
+        ('metrics', 'GET', '/metrics', None),
+        ('board events', 'GET', '/api/boards/%s/events' % b, None),
+        ('export jsonl', 'GET', '/%s/export?format=jsonl' % b, None),
+        ('export csv', 'GET', '/%s/export?format=csv' % b, None),
+        ('import form', 'GET', '/import', None),
+        ('create_board form', 'GET', '/create', None),
+        ('delete_board form', 'GET', '/%s/delete' % b, None),
+        ('add_group form', 'GET', '/%s/add_group' % b, None),
+        ('edit_profile form', 'GET', '/edit-profile', None),
+        ('remove_collab form', 'GET', '/%s/remove_collab/%s' % (b, ids['collaborator']), None),
+        ('remove_assignee form', 'GET', '/%s/%s/%s' % (b, t, ids['owner']), None),
+        ('update_comment form', 'GET', '/%s/%s/%s/update_comment' % (b, t, cm), None),
+        ('delete_comment form', 'GET', '/%s/%s/%s/delete_comment' % (b, t, cm), None),
+        ('signup', 'POST', '/signup', lambda i: {'email': 'benchnew%d@example.com' % i,
+            'username': 'benchnew%03d' % i, 'password': 'benchpassword'}),
+        ('edit_profile', 'POST', '/edit-profile', {'bio': 'Benchmark bio'}),
+        ('create_board', 'POST', '/create', {'title': 'Benchmark board', 'description': 'New'}),
+        ('update_board', 'POST', '/%s/update' % b,
+            {'title': 'Benchmark board', 'description': 'Synthetic data', 'private': 'Private'}),
+        ('add_group', 'POST', '/%s/add_group' % b, {'title': 'Benchmark group'}),
+        ('update_group', 'POST', '/%s/%s' % (b, gr), {'title': 'Group 0'}),
+        ('add_collab', 'POST', '/%s/add_collab' % b, lambda i: {'user': ids['extras'][i]}),
+        ('remove_collab', 'POST', lambda i: '/%s/remove_collab/%s' % (b, ids['extras'][i]), confirm),
+        ('update_comment', 'POST', '/%s/%s/%s/update_comment' % (b, t, cm), {'text': 'Edited comment'}),
+        ('import', 'POST', '/import', lambda i: {'file': (io.BytesIO(ids['export']), 'board.jsonl')}),
+        ('delete_comment', 'POST', lambda i: '/%s/%s/%s/delete_comment' % (sb, st, ids['scratch_comments'][i]),
+            confirm),
+        ('delete_ticket', 'POST', lambda i: '/%s/%s/%s/delete' % (sb, sg, ids['scratch_tickets'][i]), confirm),
+        ('remove_assignee', 'POST', lambda i: '/%s/%s/%s' % (sb, ids['assigned_tickets'][i], ids['owner']),
+            confirm),
+        ('delete_group', 'POST', lambda i: '/%s/%s/delete' % (sb, ids['scratch_groups'][i]), confirm),
+        ('delete_board', 'POST', lambda i: '/%s/delete' % ids['scratch_boards'][i], confirm),
+    ]
+
+
+def unbenchmarked(m, routes):
+    """(endpoint, method) pairs that no route covers and NOT_BENCHMARKED
+    does not explain."""
+    urls = m.app.url_map.bind('localhost')
+    # Signing in is measured on its own before the routes.
+    covered = {('login', 'POST')}
+
+    for name, method, path, data in routes:
+        path = path(0) if callable(path) else path
+        covered.add((urls.match(path.split('?')[0], method)[0], method))
+
+    return sorted((rule.endpoint, method) for rule in m.app.url_map.iter_rules()
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+        if (rule.endpoint, method) not in covered and (rule.endpoint, method) not in NOT_BENCHMARKED)
+
+
+class StatementCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='tracker-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    # Each route is hit in a tight loop, which the rate limiter would refuse.
+    os.environ.setdefault('RATE_LIMIT', '0')
+    # Send the opening event and close, rather than hold the stream open.
+    os.environ.setdefault('EVENT_STREAM_SECONDS', '0')
+
+    import app as m
+    from sqlalchemy import event
+
+    m.app.config['WTF_CSRF_ENABLED'] = False
+
+    with m.app.app_context():
+        m.db.drop_all()
+        m.db.create_all()
+        m.migrations.upgrade(m.db.engine)
+        ids = seed(m, args)
+        engine = m.db.engine
+
+    counter = StatementCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+
+    client = m.app.test_client()
+
+    started = time.perf_counter()
+    client.post('/login', data={'username': ids['owner'], 'password': 'benchpassword'})
+    login_time = time.perf_counter() - started
+    login_statements = counter.count
+
+    # Fill the user cache so the first route is not charged for it.
+    client.get('/profile')
+
+    # The scratch board is small, so importing it does not swamp the database.
+    ids['export'] = client.get('/%s/export?format=jsonl' % ids['scratch']).get_data()
+
+    print('%d groups, %d tickets, %d assignees/ticket, %d comments, %d requests/route on %s\n' % (
+        args.groups, args.tickets, args.assignees, args.comments, args.requests, engine.url.drivername))
+    print('%-26s %9s %9s %6s %7s %10s' % ('route', 'p50 ms', 'p95 ms', 'stmts', 'budget', 'peak KiB'))
+
+    failures = ['not benchmarked: %s %s' % pair for pair in unbenchmarked(m, routes(ids))]
+
+    def report(name, samples, statements, peak):
+        budget = QUERY_BUDGETS.get(name)
+        flag = ''
+
+        if budget is not None and statements > budget:
+            failures.append(name)
+            flag = '  OVER BUDGET'
+
+        print('%-26s %9.2f %9.2f %6d %7s %10.1f%s' % (name, percentile(samples, 50) * 1000,
+            percentile(samples, 95) * 1000, statements, budget if budget is not None else '-',
+            peak / 1024.0, flag))
+
+    report('login', [login_time], login_statements, 0)
+
+    for name, method, route_path, route_data in routes(ids):
+        samples = []
+        statements = 0
+        headers = {}
+
+        if name == 'board json (304)':
+            headers['If-None-Match'] = client.get(route_path).headers['ETag']
+
+        for i in range(args.requests + 1):
+            if name.endswith('(cold cache)'):
+                m.board_cache.clear()
+
+            path = route_path(i) if callable(route_path) else route_path
+            data = route_data(i) if callable(route_data) else route_data
+            counter.count = 0
+
+            # The last request runs under tracemalloc for the memory figure
+            # only, so tracing overhead stays out of the latency numbers.
+            if i == args.requests:
+                tracemalloc.start()
+
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=data, headers=headers)
+            # Streamed bodies only run their queries as they are read.
+            response.get_data()
+            response.close()
+            elapsed = time.perf_counter() - started
+
+            if i == args.requests:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                samples.append(elapsed)
+
+            statements = max(statements, counter.count)
+
+            if response.status_code >= 400:
+                break
+
+        if response.status_code >= 400:
+            print('%s: HTTP %d' % (name, response.status_code), file=sys.stderr)
+            failures.append(name)
+            continue
+
+        report(name, samples, statements, peak)
+
+    if failures:
+        print('\nFailed: %s' % ', '.join(failures), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+
+
+# Every record carries a type and some of these fields:
+#   board        title, description, private, owner
+#   collaborator user
+#   group        id, title
+#   ticket       id, group, text, status
+#   assignee     ticket, user
+#   comment      id, ticket, user, text, created_at
+# Records come in that order, so a reader has seen everything a record
+# refers to by the time it arrives.
+FIELDS = ['type', 'id', 'group', 'ticket', 'user', 'title', 'description', 'private',
+    'text', 'status', 'created_at', 'owner']
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def chunked(lines):
+    """Join lines into chunks of about CHUNK_SIZE characters for streaming."""
+    chunk = []
+    size = 0
+
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def csv_lines(records):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    for record in records:
+        writer.writerow(record)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+    yield buf.getvalue()
+
+
+def encode(records, format):
+    """Yield the records as text chunks in format, one record at a time."""
+    if format == 'csv':
+        return chunked(csv_lines(records))
+
+    return chunked(json.dumps(record) + '\n' for record in records)
+
+
+def decode(stream, format):
+    """Yield records from a text stream in format. Raises ValueError on
+    anything that is not a record."""
+    if format == 'csv':
+        rows = csv.DictReader(stream)
+
+        if rows.fieldnames is None or 'type' not in rows.fieldnames:
+            raise ValueError("CSV export is missing its header row.")
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+
+    try:
+        for row in rows:
+            if not isinstance(row, dict) or not row.get('type'):
+                raise ValueError("Record without a type.")
+
+            yield row
+    except csv.Error as e:
+        raise ValueError(str(e))
+
+
+def format_of(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+
+    return extension if extension in FORMATS else None
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """In-process cache bounded by entry count and total length of stored text."""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+
+            if old is not None:
+                self.size -= len(old)
+
+            self.entries[key] = value
+            self.size += len(value)
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class TTLCache:
+    """In-process LRU whose entries also expire ttl seconds after being set."""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires, value = entry
+
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemCache:
+    """Cache shared by every worker on a host, stored as one file per key.
+
+    Writes go through a temp file and an atomic rename so readers never see
+    a partial entry. When the directory grows past max_entries the least
+    recently written files are pruned.
+    """
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(value)
+
+        os.replace(tmp, self.path(key))
+        self.prune()
+
+    def prune(self):
+        names = [n for n in os.listdir(self.directory) if not n.startswith('.tmp')]
+
+        if len(names) <= self.max_entries:
+            return
+
+        paths = [os.path.join(self.directory, n) for n in names]
+        paths.sort(key=lambda p: os.stat(p).st_mtime)
+
+        for p in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class FragmentCache:
+    """Counts hits and misses in front of any backend with get/set/clear.
+
+    Keys are prefixed with release, so entries written by another release
+    of the app are never read.
+    """
+
+    def __init__(self, backend, release=''):
+        self.backend = backend
+        self.release = release
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get('%s:%s' % (self.release, key))
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        self.backend.set('%s:%s' % (self.release, key), value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'backend': type(self.backend).__name__, 'release': self.release,
+            'hits': self.hits, 'misses': self.misses}
+
+
+def from_environ(environ, release=''):
+    """Build the board cache from BOARD_CACHE_DIR / BOARD_CACHE_SIZE / BOARD_CACHE_BYTES.
+
+    Setting BOARD_CACHE_DIR selects the shared filesystem backend; otherwise
+    each worker keeps its own LRU. CACHE_VERSION, when set, replaces release
+    as the key prefix.
+    """
+    size = int(environ.get('BOARD_CACHE_SIZE', 256))
+
+    if environ.get('BOARD_CACHE_DIR'):
+        backend = FileSystemCache(environ['BOARD_CACHE_DIR'], max_entries=size)
+    else:
+        backend = LRUCache(max_entries=size,
+            max_bytes=int(environ.get('BOARD_CACHE_BYTES', 32 * 1024 * 1024)))
+
+    return FragmentCache(backend, release=environ.get('CACHE_VERSION') or release)
@@ -0,0 +1,136 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+
+
+class Subscription:
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=256)
+
+    def get(self, timeout):
+        """Return the next payload, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Publishes board events to subscribers in this process only."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+
+        with self.lock:
+            self.subscribers[channel].add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers[subscription.channel].discard(subscription)
+
+            if not self.subscribers[subscription.channel]:
+                del self.subscribers[subscription.channel]
+
+    def publish(self, channel, payload):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(payload)
+            except queue.Full:
+                # A stalled client; it will notice the version gap and reload.
+                pass
+
+
+class SQLiteBroker(LocalBroker):
+    """Relays events between processes through a shared SQLite file.
+
+    publish() appends to an events table; a background thread in each
+    process tails the table and hands new rows to local subscribers. Good
+    enough for several workers on one host and for tests; swap in a real
+    message bus for multi-host deployments.
+    """
+
+    def __init__(self, path, poll_interval=0.5, keep_seconds=300):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.keep_seconds = keep_seconds
+        self.tailing_pid = None
+
+        with closing(self.connect()) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'channel TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL)')
+
+    def subscribe(self, channel):
+        self.start_tailing()
+
+        return super().subscribe(channel)
+
+    def start_tailing(self):
+        """Start the tail thread in this process if it is not running yet.
+
+        Started on first subscribe rather than at import, because threads
+        do not survive the fork when gunicorn preloads the app.
+        """
+        with self.lock:
+            if self.tailing_pid == os.getpid():
+                return
+
+            with closing(self.connect()) as conn:
+                self.last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+            self.tailing_pid = os.getpid()
+            threading.Thread(target=self.tail, daemon=True).start()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def publish(self, channel, payload):
+        now = time.time()
+
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT INTO events (channel, payload, created) VALUES (?, ?, ?)',
+                (channel, json.dumps(payload), now))
+            conn.execute('DELETE FROM events WHERE created < ?', (now - self.keep_seconds,))
+
+    def tail(self):
+        while True:
+            time.sleep(self.poll_interval)
+
+            try:
+                with closing(self.connect()) as conn:
+                    rows = conn.execute('SELECT id, channel, payload FROM events WHERE id > ? ORDER BY id',
+                        (self.last_id,)).fetchall()
+            except sqlite3.Error:
+                continue
+
+            for event_id, channel, payload in rows:
+                self.last_id = event_id
+                LocalBroker.publish(self, channel, json.loads(payload))
+
+
+def from_environ(environ):
+    """Use the SQLite relay when EVENTS_DB names a file, else stay in-process."""
+    if environ.get('EVENTS_DB'):
+        return SQLiteBroker(environ['EVENTS_DB'])
+
+    return LocalBroker()
@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SelectField
+from flask_wtf.file import FileField, FileRequired
+from wtforms import StringField, PasswordField, BooleanField, SelectField, SelectMultipleField
 from wtforms.validators import InputRequired, Email, Length
 
 
@@ -52,6 +53,18 @@ class TicketUpdateForm(FlaskForm):
     assign = StringField('Assign collaborator to ticket')
 
 
+class BulkTicketForm(FlaskForm):
+    # Ticket and group choices depend on the board, so the route checks them.
+    tickets = SelectMultipleField('Tickets', choices=[], validate_choice=False)
+    status = SelectField('Status', choices=[("", "No change"), (" ", " "), ("Working On It", "Working On It"), ("Completed", "Completed")])
+    assign = StringField('Assign collaborator')
+    group = SelectField('Move to group', choices=[], validate_choice=False)
+
+
 class CommentForm(FlaskForm):
     text = StringField('Comment')
     
+
+
+class ImportForm(FlaskForm):
+    file = FileField('Board export (.jsonl or .csv)', validators=[FileRequired()])
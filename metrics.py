@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, has_app_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENTS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES = (1024, 10240, 102400, 1048576, 10485760)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def exposition(self, name, labels):
+        lines = []
+        cumulative = 0
+
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, self.count))
+        lines.append('%s_sum{%s} %s' % (name, labels, repr(self.total)))
+        lines.append('%s_count{%s} %d' % (name, labels, self.count))
+
+        return lines
+
+
+class TimedTemplate(Template):
+    """Adds each top-level render to the sampled request's template time."""
+
+    def render(self, *args, **kwargs):
+        sample = g.get('metrics') if has_app_context() else None
+
+        if sample is None:
+            return super().render(*args, **kwargs)
+
+        started = time.perf_counter()
+
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            sample['template'] += time.perf_counter() - started
+
+
+class Metrics:
+    """Per-endpoint request metrics for this worker, in Prometheus text format.
+
+    Requests are sampled at sample_rate; unsampled requests cost one random()
+    call. SQL is timed through engine cursor events, templates through
+    TimedTemplate. Each gunicorn worker keeps its own numbers.
+    """
+
+    histograms = [
+        ('tracker_request_seconds', 'Request latency.', 'latency', SECONDS),
+        ('tracker_request_statements', 'SQL statements per request.', 'statements', STATEMENTS),
+        ('tracker_request_db_seconds', 'Time spent executing SQL per request.', 'db', SECONDS),
+        ('tracker_request_template_seconds', 'Time spent rendering templates per request.', 'template', SECONDS),
+        ('tracker_response_bytes', 'Response body size.', 'size', BYTES),
+    ]
+
+    def __init__(self, app=None, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.series = defaultdict(lambda: {key: Histogram(buckets)
+            for _, _, key, buckets in self.histograms})
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.jinja_env.template_class = TimedTemplate
+
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g.metrics = {'started': time.perf_counter(), 'statements': 0, 'db': 0.0,
+                'template': 0.0, 'cursor': None}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        sample = g.get('metrics') if has_app_context() else None
+
+        if sample is not None:
+            sample['cursor'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        sample = g.get('metrics') if has_app_context() else None
+
+        if sample is not None and sample['cursor'] is not None:
+            sample['statements'] += 1
+            sample['db'] += time.perf_counter() - sample['cursor']
+            sample['cursor'] = None
+
+    def finish(self, response):
+        sample = g.pop('metrics', None)
+
+        if sample is None:
+            return response
+
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        labels = 'endpoint="%s",method="%s"' % (endpoint, request.method)
+        values = {
+            'latency': time.perf_counter() - sample['started'],
+            'statements': sample['statements'],
+            'db': sample['db'],
+            'template': sample['template'],
+            'size': response.content_length or 0,
+        }
+
+        with self.lock:
+            self.requests['%s,status="%d"' % (labels, response.status_code)] += 1
+
+            for key, histogram in self.series[labels].items():
+                histogram.observe(values[key])
+
+        return response
+
+    def exposition(self):
+        lines = ['# HELP tracker_requests_total Sampled requests by endpoint and status.',
+            '# TYPE tracker_requests_total counter']
+
+        with self.lock:
+            for labels, n in sorted(self.requests.items()):
+                lines.append('tracker_requests_total{%s} %d' % (labels, n))
+
+            for name, help, key, _ in self.histograms:
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s histogram' % name)
+
+                for labels, series in sorted(self.series.items()):
+                    lines.extend(series[key].exposition(name, labels))
+
+        return '\n'.join(lines) + '\n'
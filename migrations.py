@@ -0,0 +1,382 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+
+def has_column(conn, table, column):
+    return column in [c['name'] for c in inspect(conn).get_columns(table)]
+
+
+def parent_key(conn):
+    """The column rows used to refer to their parents by: public_id until
+    integer_keys, id after it and in databases created since."""
+    return 'id' if inspect(conn).get_foreign_keys('ticket') else 'public_id'
+
+
+def rekey_duplicates(conn, table, scope=None):
+    """Give a new public_id to every row but the oldest that shares one,
+    within the same scope column when given, so a unique index can go on.
+
+    The oldest row keeps its id, and with it any links to it.
+    """
+    same_scope = ' AND other.%s = "%s".%s' % (scope, table, scope) if scope else ''
+    ids = conn.execute(text('SELECT id FROM "%s" WHERE EXISTS (SELECT 1 FROM "%s" AS other '
+        'WHERE other.public_id = "%s".public_id AND other.id < "%s".id%s)' % (
+        table, table, table, table, same_scope))).fetchall()
+
+    if ids:
+        conn.execute(text('UPDATE "%s" SET public_id = :public_id WHERE id = :id' % table),
+            [{'id': row[0], 'public_id': uuid.uuid4().hex[:12]} for row in ids])
+
+
+def lookup_indexes(conn):
+    # Ids were seven random characters, so an older database may hold two
+    # boards with the same one; only the first could ever be opened.
+    rekey_duplicates(conn, 'board')
+
+    statements = [
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_board_public_id ON board (public_id)',
+        'CREATE INDEX IF NOT EXISTS ix_board_owner ON board (owner)',
+
+        'CREATE INDEX IF NOT EXISTS ix_collaborator_board_user ON collaborator (board_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_collaborator_user_id ON collaborator (user_id)',
+
+        # Groups, tickets and comments are looked up within their board, and
+        # board_scoped_ids makes them unique there once board_id is an integer.
+        'CREATE INDEX IF NOT EXISTS ix_group_public_id ON "group" (public_id)',
+        'CREATE INDEX IF NOT EXISTS ix_group_board_id ON "group" (board_id)',
+
+        'CREATE INDEX IF NOT EXISTS ix_ticket_public_id ON ticket (public_id)',
+        'CREATE INDEX IF NOT EXISTS ix_ticket_board_group ON ticket (board_id, group_id)',
+        'CREATE INDEX IF NOT EXISTS ix_ticket_group_id ON ticket (group_id)',
+
+        'CREATE INDEX IF NOT EXISTS ix_assignee_ticket_user ON assignee (ticket_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_assignee_board_id ON assignee (board_id)',
+
+        'CREATE INDEX IF NOT EXISTS ix_comment_public_id ON comment (public_id)',
+        'CREATE INDEX IF NOT EXISTS ix_comment_ticket_id ON comment (ticket_id)',
+        'CREATE INDEX IF NOT EXISTS ix_comment_board_id ON comment (board_id)',
+
+        # User.username is declared unique=True, which already gives it an index.
+    ]
+
+    # integer_keys drops these columns, and newer databases never had them.
+    for table in ('assignee', 'comment'):
+        if has_column(conn, table, 'group_id'):
+            statements.append('CREATE INDEX IF NOT EXISTS ix_%s_group_id ON %s (group_id)' % (table, table))
+
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def board_version(conn):
+    if not has_column(conn, 'board', 'version'):
+        conn.execute(text('ALTER TABLE board ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+
+
+def comment_created_at(conn):
+    if not has_column(conn, 'comment', 'created_at'):
+        conn.execute(text('ALTER TABLE comment ADD COLUMN created_at TIMESTAMP'))
+
+    # Comments used to carry only a "%d/%m/%Y %H:%M:%S" string. Parse those in
+    # place; anything unreadable sorts as the oldest comment on its ticket.
+    if has_column(conn, 'comment', 'timestamp'):
+        rows = conn.execute(text(
+            'SELECT id, timestamp FROM comment WHERE created_at IS NULL')).fetchall()
+
+        params = []
+
+        for comment_id, timestamp in rows:
+            try:
+                created_at = datetime.strptime(timestamp, "%d/%m/%Y %H:%M:%S")
+            except (TypeError, ValueError):
+                created_at = datetime(1970, 1, 1)
+
+            params.append({'id': comment_id, 'created_at': created_at})
+
+        if params:
+            conn.execute(text('UPDATE comment SET created_at = :created_at WHERE id = :id'), params)
+
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_comment_ticket_created '
+        'ON comment (ticket_id, created_at, id)'))
+    conn.execute(text('DROP INDEX IF EXISTS ix_comment_ticket_id'))
+
+
+def text_search(conn):
+    """Full-text index over ticket and comment text, queried by search.py.
+
+    SQLite gets external-content FTS5 tables kept in sync by triggers.
+    Postgres gets GIN expression indexes, which it maintains itself.
+    """
+    # Search checks access through comment.board_id, which comments did not
+    # record until now.
+    conn.execute(text('UPDATE comment SET board_id = (SELECT ticket.board_id FROM ticket '
+        'WHERE ticket.%s = comment.ticket_id) WHERE board_id IS NULL' % parent_key(conn)))
+
+    if conn.dialect.name == 'sqlite':
+        for table in ('ticket', 'comment'):
+            statements = [
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {t}_search USING fts5(text, "
+                    "content='{t}', content_rowid='id', tokenize='porter unicode61')",
+
+                "CREATE TRIGGER IF NOT EXISTS {t}_search_insert AFTER INSERT ON {t} BEGIN "
+                    "INSERT INTO {t}_search (rowid, text) VALUES (new.id, new.text); END",
+
+                "CREATE TRIGGER IF NOT EXISTS {t}_search_delete AFTER DELETE ON {t} BEGIN "
+                    "INSERT INTO {t}_search ({t}_search, rowid, text) VALUES ('delete', old.id, old.text); END",
+
+                "CREATE TRIGGER IF NOT EXISTS {t}_search_update AFTER UPDATE OF text ON {t} BEGIN "
+                    "INSERT INTO {t}_search ({t}_search, rowid, text) VALUES ('delete', old.id, old.text); "
+                    "INSERT INTO {t}_search (rowid, text) VALUES (new.id, new.text); END",
+
+                "INSERT INTO {t}_search ({t}_search) VALUES ('rebuild')",
+            ]
+
+            for statement in statements:
+                conn.execute(text(statement.format(t=table)))
+
+    elif conn.dialect.name == 'postgresql':
+        for table in ('ticket', 'comment'):
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_{t}_text_search ON {t} "
+                "USING GIN (to_tsvector('english', coalesce(text, '')))".format(t=table)))
+
+
+PROGRESS_COLUMNS = ['ticket_count', 'working_count', 'completed_count', 'unassigned_count']
+
+# Actual counters per group, or per board, counted from the tickets. A ticket
+# only counts towards a board through one of the board's groups, like it is
+# shown on the board page.
+PROGRESS_SQL = """
+    SELECT %s.public_id, COUNT(ticket.id),
+        SUM(CASE WHEN ticket.status = 'Working On It' THEN 1 ELSE 0 END),
+        SUM(CASE WHEN ticket.status = 'Completed' THEN 1 ELSE 0 END),
+        SUM(CASE WHEN ticket.id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM assignee WHERE assignee.ticket_id = ticket.id) THEN 1 ELSE 0 END)
+    FROM %s
+    GROUP BY %s.public_id
+"""
+
+PROGRESS_SOURCES = [
+    ('group', PROGRESS_SQL % ('"group"', '"group" LEFT JOIN ticket ON ticket.group_id = "group".id',
+        '"group"')),
+    ('board', PROGRESS_SQL % ('board', 'board LEFT JOIN "group" ON "group".board_id = board.id '
+        'LEFT JOIN ticket ON ticket.group_id = "group".id', 'board')),
+]
+
+
+def rebuild_progress(conn, fix=True):
+    """Recount every group's and board's progress counters from the tickets.
+
+    Returns (table, public_id, column, stored, actual) for each counter that
+    had drifted, and unless fix is False writes the actual values back.
+    """
+    drift = []
+
+    for table, actual_sql in PROGRESS_SOURCES:
+        stored = {row[0]: row[1:] for row in conn.execute(text('SELECT public_id, %s FROM "%s"' % (
+            ', '.join(PROGRESS_COLUMNS), table)))}
+        updates = []
+
+        for row in conn.execute(text(actual_sql)):
+            public_id, actual = row[0], [int(n or 0) for n in row[1:]]
+            before = stored.get(public_id)
+
+            if before is None or list(before) == actual:
+                continue
+
+            drift.extend((table, public_id, column, was, now)
+                for column, was, now in zip(PROGRESS_COLUMNS, before, actual) if was != now)
+            updates.append(dict(zip(PROGRESS_COLUMNS, actual), public_id=public_id))
+
+        if fix and updates:
+            conn.execute(text('UPDATE "%s" SET %s WHERE public_id = :public_id' % (table,
+                ', '.join('%s = :%s' % (column, column) for column in PROGRESS_COLUMNS))), updates)
+
+    return drift
+
+
+def progress_counters(conn):
+    for table in ('board', 'group'):
+        for column in PROGRESS_COLUMNS:
+            if not has_column(conn, table, column):
+                conn.execute(text('ALTER TABLE "%s" ADD COLUMN %s INTEGER NOT NULL DEFAULT 0' % (
+                    table, column)))
+
+    # Counting needs integer keys on existing databases, so integer_keys
+    # fills the counters in.
+    if parent_key(conn) == 'id':
+        rebuild_progress(conn)
+
+
+def board_activity(conn):
+    if not has_column(conn, 'board', 'updated_at'):
+        conn.execute(text('ALTER TABLE board ADD COLUMN updated_at TIMESTAMP'))
+
+    # The newest comment is the best record of past activity there is; boards
+    # without one start from now.
+    conn.execute(text('UPDATE board SET updated_at = COALESCE((SELECT MAX(comment.created_at) '
+        'FROM comment WHERE comment.board_id = board.%s), :now) WHERE updated_at IS NULL' % parent_key(conn)),
+        {'now': datetime.now()})
+
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_board_updated ON board (updated_at, id)'))
+
+    # The index page reads titles from the board itself now, so the copy
+    # taken when a collaborator was added is no longer needed.
+    if has_column(conn, 'collaborator', 'board_title'):
+        conn.execute(text('ALTER TABLE collaborator DROP COLUMN board_title'))
+
+
+# Indexes over the columns integer_keys rewrites, as (name, table, columns).
+KEY_INDEXES = [
+    ('ix_collaborator_board_user', 'collaborator', 'board_id, user_id'),
+    ('ix_group_board_id', 'group', 'board_id'),
+    ('ix_ticket_board_group', 'ticket', 'board_id, group_id'),
+    ('ix_ticket_group_id', 'ticket', 'group_id'),
+    ('ix_assignee_ticket_user', 'assignee', 'ticket_id, user_id'),
+    ('ix_assignee_board_id', 'assignee', 'board_id'),
+    ('ix_comment_ticket_created', 'comment', 'ticket_id, created_at, id'),
+    ('ix_comment_board_id', 'comment', 'board_id'),
+]
+
+# (table, column, parent table, the new value computed from the old row).
+# Tickets take their board from their group, and assignees and comments
+# theirs from their ticket, so no row can disagree with its parent.
+INTEGER_KEYS = [
+    ('collaborator', 'board_id', 'board',
+        'SELECT board.id FROM board WHERE board.public_id = collaborator.board_id'),
+    ('group', 'board_id', 'board',
+        'SELECT board.id FROM board WHERE board.public_id = "group".board_id'),
+    ('ticket', 'group_id', 'group',
+        'SELECT "group".id FROM "group" WHERE "group".public_id = ticket.group_id'),
+    ('ticket', 'board_id', 'board',
+        'SELECT "group".board_id FROM "group" WHERE "group".public_id = ticket.group_id'),
+    ('assignee', 'ticket_id', 'ticket',
+        'SELECT ticket.id FROM ticket WHERE ticket.public_id = assignee.ticket_id'),
+    ('assignee', 'board_id', 'board',
+        'SELECT ticket.board_id FROM ticket WHERE ticket.public_id = assignee.ticket_id'),
+    ('comment', 'ticket_id', 'ticket',
+        'SELECT ticket.id FROM ticket WHERE ticket.public_id = comment.ticket_id'),
+    ('comment', 'board_id', 'board',
+        'SELECT ticket.board_id FROM ticket WHERE ticket.public_id = comment.ticket_id'),
+]
+
+# Rows whose parent is gone, deleted parents first so their children follow.
+ORPHANS = [
+    'DELETE FROM "group" WHERE NOT EXISTS (SELECT 1 FROM board WHERE board.public_id = "group".board_id)',
+    'DELETE FROM collaborator WHERE NOT EXISTS (SELECT 1 FROM board '
+        'WHERE board.public_id = collaborator.board_id)',
+    'DELETE FROM ticket WHERE NOT EXISTS (SELECT 1 FROM "group" WHERE "group".public_id = ticket.group_id)',
+    'DELETE FROM assignee WHERE NOT EXISTS (SELECT 1 FROM ticket WHERE ticket.public_id = assignee.ticket_id)',
+    'DELETE FROM comment WHERE NOT EXISTS (SELECT 1 FROM ticket WHERE ticket.public_id = comment.ticket_id)',
+]
+
+
+def integer_keys(conn):
+    """Point rows at their parents by integer id, with foreign keys.
+
+    Each column is rebuilt in place: a new integer column that references
+    the parent is filled from the old public_id, then replaces it. Rows
+    whose parent no longer exists are deleted first, and the never-filled
+    assignee and comment group_id columns are dropped.
+    """
+    if parent_key(conn) == 'id':
+        return
+
+    for statement in ORPHANS:
+        conn.execute(text(statement))
+
+    for name, table, columns in KEY_INDEXES:
+        conn.execute(text('DROP INDEX IF EXISTS %s' % name))
+
+    for table in ('assignee', 'comment'):
+        conn.execute(text('DROP INDEX IF EXISTS ix_%s_group_id' % table))
+
+        if has_column(conn, table, 'group_id'):
+            conn.execute(text('ALTER TABLE %s DROP COLUMN group_id' % table))
+
+    # Tables go parent first: a child's lookups read its parent's new ids.
+    for table in ('collaborator', 'group', 'ticket', 'assignee', 'comment'):
+        keys = [(column, parent, lookup) for t, column, parent, lookup in INTEGER_KEYS if t == table]
+
+        for column, parent, lookup in keys:
+            conn.execute(text('ALTER TABLE "%s" ADD COLUMN %s_new INTEGER REFERENCES "%s" (id)' % (
+                table, column, parent)))
+            conn.execute(text('UPDATE "%s" SET %s_new = (%s)' % (table, column, lookup)))
+
+        for column, parent, lookup in keys:
+            conn.execute(text('ALTER TABLE "%s" DROP COLUMN %s' % (table, column)))
+            conn.execute(text('ALTER TABLE "%s" RENAME COLUMN %s_new TO %s' % (table, column, column)))
+
+    for name, table, columns in KEY_INDEXES:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS %s ON "%s" (%s)' % (name, table, columns)))
+
+    rebuild_progress(conn)
+
+
+def assignee_status(conn):
+    if not has_column(conn, 'assignee', 'status'):
+        conn.execute(text("ALTER TABLE assignee ADD COLUMN status VARCHAR NOT NULL DEFAULT ''"))
+
+    conn.execute(text("UPDATE assignee SET status = COALESCE((SELECT ticket.status FROM ticket "
+        "WHERE ticket.id = assignee.ticket_id), '')"))
+
+    # Serves each user's tickets by status, in id order, straight from the index.
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_assignee_user_status ON assignee (user_id, status, id)'))
+
+
+def board_scoped_ids(conn):
+    """Make group, ticket and comment ids unique within their board rather
+    than across every board, which is all lookups need."""
+    for table in ('group', 'ticket', 'comment'):
+        rekey_duplicates(conn, table, scope='board_id')
+
+        conn.execute(text('DROP INDEX IF EXISTS ux_%s_public_id' % table))
+        conn.execute(text('DROP INDEX IF EXISTS ix_%s_public_id' % table))
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ux_{t}_board_public_id '
+            'ON "{t}" (board_id, public_id)'.format(t=table)))
+
+
+# Ordered list of (version, description, function). Append new migrations to
+# the end and never renumber ones that have already shipped.
+MIGRATIONS = [
+    (1, 'Add lookup indexes and unique public_id constraints', lookup_indexes),
+    (2, 'Add board version counter for page caching', board_version),
+    (3, 'Store comment times as datetimes indexed by ticket', comment_created_at),
+    (4, 'Add full-text search over tickets and comments', text_search),
+    (5, 'Add per-board and per-group progress counters', progress_counters),
+    (6, 'Track board activity and drop Collaborator.board_title', board_activity),
+    (7, 'Refer to parent rows by integer foreign keys', integer_keys),
+    (8, "Copy ticket status onto assignees for each user's ticket list", assignee_status),
+    (9, 'Make group, ticket and comment ids unique per board', board_scoped_ids),
+]
+
+
+def current_version(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    version = conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+
+    return version or 0
+
+
+def upgrade(engine):
+    """Apply every migration newer than the database's schema_version.
+
+    Each migration runs in its own transaction together with its version
+    bump, so a failure leaves the database at the last good version.
+    Returns the list of versions that were applied.
+    """
+    applied = []
+
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+
+            if version <= current_version(conn):
+                continue
+
+            migrate(conn)
+            conn.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': version})
+
+        applied.append((version, description))
+
+    return applied
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+DEFAULT_METHOD = 'pbkdf2:sha256:260000'
+
+
+class Busy(Exception):
+    """Raised when the hashing pool is already holding max_pending jobs."""
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded thread pool.
+
+    pbkdf2 in hashlib releases the GIL, so a few pool threads hash in
+    parallel while the request threads wait. At most max_pending jobs may
+    be queued or running; beyond that callers get Busy straight away
+    instead of piling up behind a login storm.
+
+    method is checked by hashing once up front, so a bad setting fails at
+    startup rather than on someone's login. Werkzeug fills in a default
+    cost, so the prefix that hash actually carries is what needs_rehash
+    compares against.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=None, max_pending=None):
+        try:
+            self.prefix = generate_password_hash('', method).split('$', 1)[0]
+        except ValueError as e:
+            raise ValueError('Invalid password hash method %r: %s' % (method, e))
+
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='pwhash')
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise Busy()
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self.slots.release())
+
+        return future.result()
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when pwhash was made with a different method or cost, such
+        as the legacy salted 'sha256' hashes."""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+
+def from_environ(environ):
+    workers = environ.get('PASSWORD_HASH_WORKERS')
+    pending = environ.get('PASSWORD_HASH_QUEUE')
+
+    return PasswordHasher(environ.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=int(workers) if workers else None,
+        max_pending=int(pending) if pending else None)
+
+
+def benchmark(method, seconds=3.0, workers=None, concurrency=None):
+    """Measure logins per second (one verify each) for method on a fresh pool."""
+    hasher = PasswordHasher(method, workers=workers)
+    concurrency = concurrency or hasher.max_pending
+    pwhash = hasher.hash('correct horse battery')
+    done = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            try:
+                hasher.verify(pwhash, 'correct horse battery')
+            except Busy:
+                time.sleep(0.001)
+                continue
+
+            with lock:
+                done[0] += 1
+
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(concurrency) as clients:
+        wait([clients.submit(client) for _ in range(concurrency)])
+
+    elapsed = time.monotonic() - started
+    hasher.executor.shutdown()
+
+    return done[0] / elapsed
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import traceback
+from collections import defaultdict
+
+from flask import current_app, g, has_app_context, request
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+HERE = os.path.abspath(__file__)
+
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|%s|:\w+'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(statement):
+    """Statement shape: literals and placeholders become ?, IN lists (...)."""
+    for pattern, replacement in LITERALS:
+        statement = pattern.sub(replacement, statement)
+
+    return statement.strip()
+
+
+def call_site(root):
+    """Innermost frame under root outside site-packages and this module."""
+    for frame in reversed(traceback.extract_stack()):
+        path = os.path.abspath(frame.filename)
+
+        if path.startswith(root) and path != HERE and 'site-packages' not in path:
+            return '%s:%d in %s' % (os.path.relpath(path, root), frame.lineno, frame.name)
+
+    return 'unknown'
+
+
+class QueryWatch:
+    """Flags N+1 patterns and slow SQL while developing.
+
+    Active when the app runs in debug mode, or always with enabled=True for
+    staging. Statements issued during a request are grouped by shape; any
+    shape run repeat times or more, and any statement slower than slow_ms,
+    is logged with its call site and summarised in an X-Query-Report
+    header and, with footer=True, a note at the end of HTML pages.
+    """
+
+    def __init__(self, app=None, enabled=None, repeat=3, slow_ms=100, footer=False):
+        self.enabled = enabled
+        self.repeat = repeat
+        self.slow = slow_ms / 1000.0
+        self.footer = footer
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.enabled is False:
+            return
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start(self):
+        if self.enabled or current_app.debug:
+            g.query_watch = {'statements': [], 'started': None}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        watch = g.get('query_watch') if has_app_context() else None
+
+        if watch is not None:
+            watch['started'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        watch = g.get('query_watch') if has_app_context() else None
+
+        if watch is not None and watch['started'] is not None:
+            elapsed = time.perf_counter() - watch['started']
+            watch['statements'].append((normalize(statement), elapsed, call_site(current_app.root_path)))
+            watch['started'] = None
+
+    def findings(self, statements):
+        by_shape = defaultdict(list)
+
+        for shape, elapsed, site in statements:
+            by_shape[shape].append((elapsed, site))
+
+        repeated = [(shape, runs) for shape, runs in by_shape.items() if len(runs) >= self.repeat]
+        slow = [(shape, elapsed, site) for shape, elapsed, site in statements if elapsed >= self.slow]
+
+        return repeated, slow
+
+    def report(self, statements, repeated, slow):
+        lines = ['%d statements, %d repeated shapes, %d slow' % (len(statements), len(repeated), len(slow))]
+
+        for shape, runs in repeated:
+            sites = sorted(set(site for _, site in runs))
+            lines.append('repeated %dx from %s: %s' % (len(runs), ', '.join(sites), shape))
+
+        for shape, elapsed, site in slow:
+            lines.append('slow %.1f ms from %s: %s' % (elapsed * 1000, site, shape))
+
+        return lines
+
+    def finish(self, response):
+        watch = g.pop('query_watch', None)
+
+        if watch is None or not watch['statements']:
+            return response
+
+        repeated, slow = self.findings(watch['statements'])
+        lines = self.report(watch['statements'], repeated, slow)
+        response.headers['X-Query-Report'] = lines[0]
+
+        if not repeated and not slow:
+            return response
+
+        current_app.logger.warning('Query report for %s %s:\n  %s', request.method, request.path,
+            '\n  '.join(lines))
+
+        if self.footer and response.mimetype == 'text/html' and not response.direct_passthrough \
+                and not response.is_streamed:
+            note = '<pre class="query-report">%s</pre></body>' % escape('\n'.join(lines))
+            response.set_data(response.get_data(as_text=True).replace('</body>', note, 1))
+
+        return response
+
+
+def from_environ(environ):
+    enabled = environ.get('QUERY_WATCH')
+
+    return QueryWatch(enabled=None if enabled is None else enabled == '1',
+        repeat=int(environ.get('QUERY_WATCH_REPEAT', 3)),
+        slow_ms=float(environ.get('QUERY_WATCH_SLOW_MS', 100)),
+        footer=environ.get('QUERY_WATCH_FOOTER') == '1')
@@ -0,0 +1,248 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import closing
+
+from flask import g, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+AUTH_ENDPOINTS = ('login', 'signup')
+EXEMPT_ENDPOINTS = ('static', 'bootstrap.static', 'metrics_text', 'board_event_stream')
+DEFAULT_LIMITS = {'read': (300, 60), 'write': (60, 60), 'auth': (10, 60)}
+
+
+def refill(tokens, updated, now, capacity, period):
+    """(tokens left after taking one or None, seconds until one is free)."""
+    tokens = min(capacity, tokens + (now - updated) * capacity / period)
+
+    if tokens >= 1:
+        return tokens - 1, 0
+
+    return None, (1 - tokens) * period / capacity
+
+
+class MemoryBackend:
+    """Buckets and in-flight counts for this worker only.
+
+    Holds at most max_keys buckets; the least recently used one is dropped,
+    which only means that key starts again from a full bucket.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.in_flight = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def admit(self, bucket, capacity, period, user, max_in_flight):
+        """(outcome, seconds to wait, release token). outcome is 'allowed',
+        'limited' for an empty bucket or 'busy' for too many in flight.
+        max_in_flight None means no cap."""
+        now = time.monotonic()
+
+        with self.lock:
+            if max_in_flight is not None and self.in_flight.get(user, 0) >= max_in_flight:
+                return 'busy', 1, None
+
+            tokens, updated = self.buckets.pop(bucket, (capacity, now))
+            left, wait = refill(tokens, updated, now, capacity, period)
+            self.buckets[bucket] = (tokens if left is None else left, now)
+
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+            if left is None:
+                return 'limited', wait, None
+
+            self.in_flight[user] += 1
+
+        return 'allowed', 0, user
+
+    def release(self, token):
+        with self.lock:
+            self.in_flight[token] -= 1
+
+            if self.in_flight[token] <= 0:
+                del self.in_flight[token]
+
+
+class SQLiteBackend:
+    """Buckets and in-flight requests shared by every worker on a host.
+
+    Each admission is one short IMMEDIATE transaction on a SQLite file,
+    like the event relay. In-flight rows left behind by a killed worker stop
+    counting after stale_seconds.
+    """
+
+    def __init__(self, path, stale_seconds=300):
+        self.path = path
+        self.stale_seconds = stale_seconds
+
+        with closing(self.connect()) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, '
+                'tokens REAL NOT NULL, updated REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS in_flight (id INTEGER PRIMARY KEY, '
+                'user TEXT NOT NULL, started REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_in_flight_user ON in_flight (user, started)')
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def admit(self, bucket, capacity, period, user, max_in_flight):
+        now = time.time()
+
+        with closing(self.connect()) as conn, conn:
+            conn.execute('BEGIN IMMEDIATE')
+
+            if max_in_flight is not None:
+                running = conn.execute('SELECT COUNT(*) FROM in_flight WHERE user = ? AND started > ?',
+                    (user, now - self.stale_seconds)).fetchone()[0]
+
+                if running >= max_in_flight:
+                    return 'busy', 1, None
+
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (bucket,)).fetchone()
+
+            if row is None:
+                # A new key is a good moment to drop ones that went idle long ago.
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.stale_seconds,))
+                row = (capacity, now)
+
+            left, wait = refill(row[0], row[1], now, capacity, period)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (bucket, row[0] if left is None else left, now))
+
+            if left is None:
+                return 'limited', wait, None
+
+            conn.execute('DELETE FROM in_flight WHERE user = ? AND started <= ?',
+                (user, now - self.stale_seconds))
+            token = conn.execute('INSERT INTO in_flight (user, started) VALUES (?, ?)',
+                (user, now)).lastrowid
+
+            return 'allowed', 0, token
+
+    def release(self, token):
+        with closing(self.connect()) as conn:
+            conn.execute('DELETE FROM in_flight WHERE id = ?', (token,))
+
+
+class RateLimiter:
+    """Token-bucket rate limits and an in-flight cap per user.
+
+    Each request is charged to a bucket for its user and route class: auth
+    for sign-in and sign-up posts, write for other requests that are not
+    GET, HEAD or OPTIONS, read for the rest. A class's bucket holds
+    limits[class][0] requests and refills at that many per limits[class][1]
+    seconds. A request that finds its bucket empty, or its user with
+    max_in_flight requests already running, gets 429 with Retry-After.
+
+    Users are keyed by id once signed in and by address before, which is
+    only the client's own address when the app sits behind ProxyFix.
+    Sign-in attempts are bucketed by the username tried and the address
+    they come from, so guessing at an account from one place is slowed
+    without locking its owner out from another. Signed-out requests to the
+    sign-in and sign-up pages skip the in-flight cap, since many people
+    behind one NAT share an address and would otherwise queue for its
+    few slots.
+    """
+
+    def __init__(self, app=None, limits=None, max_in_flight=4, backend=None, enabled=True):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_in_flight = max_in_flight
+        self.backend = backend or MemoryBackend()
+        self.enabled = enabled
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def route_class(self):
+        if request.endpoint in AUTH_ENDPOINTS and request.method == 'POST':
+            return 'auth'
+
+        return 'read' if request.method in READ_METHODS else 'write'
+
+    def admit(self):
+        if request.endpoint in EXEMPT_ENDPOINTS:
+            return
+
+        route_class = self.route_class()
+
+        if current_user.is_authenticated:
+            user = 'user:%s' % current_user.get_id()
+        else:
+            user = 'addr:%s' % request.remote_addr
+
+        bucket = '%s:%s' % (route_class, user)
+
+        if route_class == 'auth' and request.form.get('username'):
+            bucket = 'auth:name:%s:%s' % (request.form['username'].lower(), request.remote_addr)
+
+        max_in_flight = self.max_in_flight
+
+        if request.endpoint in AUTH_ENDPOINTS and not current_user.is_authenticated:
+            max_in_flight = None
+
+        capacity, period = self.limits[route_class]
+        outcome, wait, token = self.backend.admit(bucket, capacity, period, user, max_in_flight)
+        self.count(route_class, outcome)
+
+        if token is None:
+            raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+
+        g.rate_limit_token = token
+
+    def release(self, exc=None):
+        token = g.pop('rate_limit_token', None)
+
+        if token is not None:
+            self.backend.release(token)
+
+    def count(self, route_class, outcome):
+        with self.lock:
+            self.counts[(route_class, outcome)] += 1
+
+    def exposition(self):
+        """Counters for this worker, in Prometheus text format. They carry no
+        user ids or addresses, since /metrics is not behind a login."""
+        lines = ['# HELP tracker_rate_limit_requests_total Requests seen by the rate limiter, '
+                'by route class and outcome.',
+            '# TYPE tracker_rate_limit_requests_total counter']
+
+        with self.lock:
+            for (route_class, outcome), n in sorted(self.counts.items()):
+                lines.append('tracker_rate_limit_requests_total{class="%s",outcome="%s"} %d'
+                    % (route_class, outcome, n))
+
+        return '\n'.join(lines) + '\n'
+
+
+def parse_limit(value):
+    """'60/60' -> (60, 60.0): a number of requests per a number of seconds."""
+    requests, seconds = value.split('/')
+
+    return int(requests), float(seconds)
+
+
+def from_environ(environ):
+    limits = {route_class: parse_limit(environ[name]) for route_class, name in
+        [('read', 'RATE_LIMIT_READS'), ('write', 'RATE_LIMIT_WRITES'), ('auth', 'RATE_LIMIT_AUTH')]
+        if environ.get(name)}
+    backend = SQLiteBackend(environ['RATE_LIMIT_DB']) if environ.get('RATE_LIMIT_DB') else None
+
+    return RateLimiter(limits=limits, backend=backend, enabled=environ.get('RATE_LIMIT') != '0',
+        max_in_flight=int(environ.get('RATE_LIMIT_IN_FLIGHT', 4)))
@@ -0,0 +1,108 @@
+import random
+import time
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, exc, orm
+
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(SignallingSession):
+    """Sends a request's queries to the replica picked for it, if any.
+
+    Flushes always go to the primary, so a read-only request that does
+    write something cannot write it to a replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        engine = g.get('read_engine') if has_app_context() else None
+
+        if engine is not None and not self._flushing:
+            return engine
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaPool:
+    """Routes read-only requests to read replicas.
+
+    GET, HEAD and OPTIONS requests read from a random healthy replica,
+    except for sticky_seconds after the same browser session last sent a
+    write, so people always see their own changes. A replica that fails
+    to connect or errors is skipped for retry_seconds, and a read that
+    failed on it is run again on the primary.
+    """
+
+    def __init__(self, urls, sticky_seconds=10, retry_seconds=30):
+        self.engines = [create_engine(url, pool_pre_ping=True) for url in urls]
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.down_until = {}
+
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self.on_error)
+
+    def init_app(self, app):
+        if not self.engines:
+            return
+
+        app.before_request(self.route)
+        app.after_request(self.remember_write)
+        app.register_error_handler(exc.OperationalError, self.retry_on_primary)
+
+    def pick(self):
+        now = time.monotonic()
+        healthy = [e for e in self.engines if self.down_until.get(e, 0) <= now]
+
+        return random.choice(healthy) if healthy else None
+
+    def mark_down(self, engine):
+        self.down_until[engine] = time.monotonic() + self.retry_seconds
+
+    def on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.mark_down(context.engine)
+
+    def route(self):
+        if request.method not in READ_METHODS:
+            return
+
+        if time.time() - session.get('wrote_at', 0) < self.sticky_seconds:
+            return
+
+        g.read_engine = self.pick()
+
+    def remember_write(self, response):
+        if request.method not in READ_METHODS:
+            session['wrote_at'] = time.time()
+
+        return response
+
+    def retry_on_primary(self, e):
+        engine = g.pop('read_engine', None)
+
+        if engine is None:
+            raise e
+
+        current_app.logger.warning('Replica %s failed, reading from the primary: %s',
+            repr(engine.url), e)
+
+        current_app.extensions['sqlalchemy'].db.session.rollback()
+        self.mark_down(engine)
+
+        return current_app.view_functions[request.endpoint](**request.view_args)
+
+
+def from_environ(environ):
+    urls = [url.strip() for url in environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+    return ReplicaPool(urls, sticky_seconds=float(environ.get('REPLICA_STICKY_SECONDS', 10)),
+        retry_seconds=float(environ.get('REPLICA_RETRY_SECONDS', 30)))
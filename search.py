@@ -0,0 +1,127 @@
+import re
+from collections import namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+
+
+PER_PAGE = 20
+
+# Snippet highlight markers, swapped for <mark> after the text is escaped.
+START, STOP = '\x02', '\x03'
+
+SearchResult = namedtuple('SearchResult', 'kind public_id ticket_id group_id board_id board_title snippet')
+
+
+HITS = {
+    'sqlite': """
+        SELECT 'ticket' AS kind, ticket.id AS row_id, ticket.public_id AS public_id,
+            ticket.public_id AS ticket_id, "group".public_id AS group_id, ticket.board_id AS board_id,
+            bm25(ticket_search) AS rank
+        FROM ticket_search JOIN ticket ON ticket.id = ticket_search.rowid
+            LEFT JOIN "group" ON "group".id = ticket.group_id
+        WHERE ticket_search MATCH :match
+        UNION ALL
+        SELECT 'comment', comment.id, comment.public_id, ticket.public_id, "group".public_id,
+            comment.board_id, bm25(comment_search)
+        FROM comment_search JOIN comment ON comment.id = comment_search.rowid
+            JOIN ticket ON ticket.id = comment.ticket_id
+            LEFT JOIN "group" ON "group".id = ticket.group_id
+        WHERE comment_search MATCH :match
+    """,
+    'postgresql': """
+        SELECT 'ticket' AS kind, ticket.id AS row_id, ticket.public_id AS public_id,
+            ticket.public_id AS ticket_id, "group".public_id AS group_id, ticket.board_id AS board_id,
+            -ts_rank(to_tsvector('english', coalesce(ticket.text, '')), plainto_tsquery('english', :match)) AS rank
+        FROM ticket LEFT JOIN "group" ON "group".id = ticket.group_id
+        WHERE to_tsvector('english', coalesce(ticket.text, '')) @@ plainto_tsquery('english', :match)
+        UNION ALL
+        SELECT 'comment', comment.id, comment.public_id, ticket.public_id, "group".public_id,
+            comment.board_id,
+            -ts_rank(to_tsvector('english', coalesce(comment.text, '')), plainto_tsquery('english', :match))
+        FROM comment JOIN ticket ON ticket.id = comment.ticket_id
+            LEFT JOIN "group" ON "group".id = ticket.group_id
+        WHERE to_tsvector('english', coalesce(comment.text, '')) @@ plainto_tsquery('english', :match)
+    """,
+}
+
+# Lower rank is a better match on both databases.
+PAGE = """
+    SELECT hit.kind, hit.row_id, hit.public_id, hit.ticket_id, hit.group_id, board.public_id AS board_id,
+        board.title
+    FROM (%s) AS hit JOIN board ON board.id = hit.board_id
+    WHERE board.owner = :username OR board.private = 'Public' OR EXISTS (
+        SELECT 1 FROM collaborator
+        WHERE collaborator.board_id = board.id AND collaborator.user_id = :username)
+    ORDER BY hit.rank, hit.row_id
+    LIMIT :limit OFFSET :offset
+"""
+
+SNIPPETS = {
+    'sqlite': "SELECT rowid, snippet({t}_search, 0, :start, :stop, '...', 16) FROM {t}_search "
+        "WHERE {t}_search MATCH :match AND rowid IN :ids",
+    'postgresql': "SELECT id, ts_headline('english', coalesce(text, ''), plainto_tsquery('english', :match), "
+        ":options) FROM {t} WHERE id IN :ids",
+}
+
+SNIPPET_PARAMS = {
+    'sqlite': {'start': START, 'stop': STOP},
+    'postgresql': {'options': 'StartSel=%s, StopSel=%s, MaxFragments=1, MaxWords=24, MinWords=8' % (START, STOP)},
+}
+
+
+def available(conn):
+    return conn.dialect.name in HITS
+
+
+def match_expression(query, dialect):
+    """The words of query in the form the database's matcher expects, or ''.
+
+    For FTS5 every word is quoted so user input can never be read as query
+    syntax, and the last word matches as a prefix.
+    """
+    words = re.findall(r'\w+', query)
+
+    if dialect != 'sqlite' or not words:
+        return ' '.join(words)
+
+    return ' '.join('"%s"' % word for word in words) + '*'
+
+
+def highlight(snippet):
+    return Markup(escape(snippet).replace(START, Markup('<mark>')).replace(STOP, Markup('</mark>')))
+
+
+def search(conn, query, username, page=1):
+    """One page of tickets and comments matching query on boards the user
+    owns, collaborates on, or that are public, best match first.
+
+    Returns (results, has_more). Costs one query for the page and one per
+    kind of result for the snippets.
+    """
+    dialect = conn.dialect.name
+    match = match_expression(query, dialect)
+
+    if not match:
+        return [], False
+
+    rows = conn.execute(text(PAGE % HITS[dialect]), match=match, username=username,
+        limit=PER_PAGE + 1, offset=(page - 1) * PER_PAGE).fetchall()
+
+    has_more = len(rows) > PER_PAGE
+    rows = rows[:PER_PAGE]
+
+    snippets = {}
+
+    for kind in ('ticket', 'comment'):
+        ids = [row.row_id for row in rows if row.kind == kind]
+
+        if ids:
+            statement = text(SNIPPETS[dialect].format(t=kind)).bindparams(bindparam('ids', expanding=True))
+            snippets[kind] = dict(conn.execute(statement, match=match, ids=ids,
+                **SNIPPET_PARAMS[dialect]).fetchall())
+
+    results = [SearchResult(row.kind, row.public_id, row.ticket_id, row.group_id, row.board_id, row.title,
+        highlight(snippets[row.kind].get(row.row_id) or '')) for row in rows]
+
+    return results, has_more
@@ -0,0 +1,274 @@
+/*
+ * Board page
+ * Groups arrive collapsed; opening one fetches its ticket rows, and open
+ * groups are remembered for the tab so they reopen after a reload. A link
+ * such as /<board>?group=<group>#ticket-<ticket> opens the group and
+ * scrolls to the ticket once its rows arrive.
+ *
+ * Live updates listen to the board's event stream and patch the page in
+ * place. Any change it cannot apply, or a gap in board versions, falls back
+ * to a full reload.
+ */
+
+(function () {
+  var board = document.querySelector('.board[data-events]');
+
+  if (!board) {
+    return;
+  }
+
+  var version = parseInt(board.getAttribute('data-version'), 10);
+  var storageKey = 'open-groups:' + board.getAttribute('data-events');
+
+  function ticket(id) {
+    return document.getElementById('ticket-' + id);
+  }
+
+  function group(id) {
+    return document.getElementById('group-' + id);
+  }
+
+  function assignee(change) {
+    var row = ticket(change.ticket);
+    var spans = row ? row.querySelectorAll('.assignee') : [];
+
+    for (var i = 0; i < spans.length; i++) {
+      if (spans[i].getAttribute('data-user') === change.user) {
+        return spans[i];
+      }
+    }
+
+    return null;
+  }
+
+  /* Collapsed groups */
+
+  function openGroups() {
+    try {
+      return JSON.parse(window.sessionStorage.getItem(storageKey)) || [];
+    } catch (e) {
+      return [];
+    }
+  }
+
+  function remember(el, open) {
+    var id = el.id.slice('group-'.length);
+    var ids = openGroups().filter(function (other) { return other !== id; });
+
+    if (open) ids.push(id);
+
+    try {
+      window.sessionStorage.setItem(storageKey, JSON.stringify(ids));
+    } catch (e) {}
+  }
+
+  // Groups waiting for their rows. They are fetched one at a time, so
+  // reopening many groups stays within the per-user in-flight limit.
+  var queue = [];
+  var fetching = false;
+
+  function load(el) {
+    el.classList.add('loading');
+    queue.push(el);
+    next();
+  }
+
+  function failed(el) {
+    el.classList.remove('loading');
+    el.querySelector('.group-toggle').textContent = 'Could not load tickets, try again';
+    el.querySelector('.group-tickets').hidden = true;
+  }
+
+  function next() {
+    if (fetching || !queue.length) return;
+
+    var el = queue.shift();
+    var request = new XMLHttpRequest();
+
+    fetching = true;
+    el.classList.remove('stale');
+
+    request.open('GET', el.querySelector('.group-toggle').getAttribute('href'));
+    request.onload = function () {
+      fetching = false;
+
+      if (request.status !== 200) {
+        failed(el);
+      } else if (el.classList.contains('stale')) {
+        // A change for this group came in while the rows were on their way.
+        queue.unshift(el);
+      } else {
+        el.querySelector('.group-tickets').innerHTML = request.responseText;
+        el.classList.remove('loading');
+        el.classList.add('loaded');
+
+        var target = window.location.hash && document.getElementById(window.location.hash.slice(1));
+        if (target && el.contains(target)) target.scrollIntoView();
+      }
+
+      next();
+    };
+    request.onerror = function () {
+      fetching = false;
+      failed(el);
+      next();
+    };
+    request.send();
+  }
+
+  function setOpen(el, open) {
+    el.querySelector('.group-tickets').hidden = !open;
+    el.querySelector('.group-toggle').textContent = open ? 'Hide tickets' : 'Show tickets';
+
+    if (open && !el.classList.contains('loaded') && !el.classList.contains('loading')) {
+      load(el);
+    }
+  }
+
+  board.addEventListener('click', function (e) {
+    var toggle = e.target.closest && e.target.closest('.group-toggle');
+    if (!toggle) return;
+
+    e.preventDefault();
+
+    var el = toggle.closest('.group');
+    var open = el.querySelector('.group-tickets').hidden;
+
+    setOpen(el, open);
+    remember(el, open);
+  });
+
+  var linked = /[?&]group=([^&#]+)/.exec(window.location.search);
+  var linkedGroup = linked && group(decodeURIComponent(linked[1]));
+
+  if (linkedGroup) remember(linkedGroup, true);
+
+  openGroups().forEach(function (id) {
+    var el = group(id);
+    if (el) setOpen(el, true);
+  });
+
+  // True when the group's rows are not on the page, so changes to them can
+  // be skipped; they are fetched fresh when it opens. A group still loading
+  // is fetched again once its rows land.
+  function unloaded(el) {
+    if (el.classList.contains('loaded')) return false;
+    if (el.classList.contains('loading')) el.classList.add('stale');
+    return true;
+  }
+
+  // For changes that name a ticket but not its group.
+  function anyUnloaded() {
+    var groups = board.querySelectorAll('.group');
+    var found = false;
+
+    for (var i = 0; i < groups.length; i++) {
+      if (unloaded(groups[i])) found = true;
+    }
+
+    return found;
+  }
+
+  function addRow(el, id, html) {
+    var row = ticket(id);
+    if (row) row.parentNode.removeChild(row);
+    el.querySelector('.group-tickets').insertAdjacentHTML('beforeend', html);
+  }
+
+  /* Live updates */
+
+  if (!window.EventSource) {
+    return;
+  }
+
+  // Each handler returns false when the page does not hold what the change
+  // refers to, which triggers a reload. Rows fetched for a group may already
+  // include a change, so applying one twice must leave the page the same.
+  var handlers = {
+    ticket_created: function (change) {
+      var el = group(change.group);
+      if (!el) return false;
+      if (unloaded(el)) return;
+      addRow(el, change.ticket, change.html);
+    },
+    ticket_updated: function (change) {
+      var row = ticket(change.ticket);
+      if (!row) return anyUnloaded() ? undefined : false;
+      row.querySelector('.ticket-text').textContent = change.text;
+      row.querySelector('.ticket-status').textContent = change.status;
+    },
+    ticket_moved: function (change) {
+      var el = group(change.group);
+      if (!el) return false;
+      var row = ticket(change.ticket);
+      if (row) row.parentNode.removeChild(row);
+      if (unloaded(el)) return;
+      addRow(el, change.ticket, change.html);
+    },
+    ticket_deleted: function (change) {
+      var row = ticket(change.ticket);
+      if (row) row.parentNode.removeChild(row);
+    },
+    assignee_added: function (change) {
+      var row = ticket(change.ticket);
+      if (!row) return anyUnloaded() ? undefined : false;
+      if (assignee(change)) return;
+      row.querySelector('.ticket-assignees').insertAdjacentHTML('beforeend', change.html);
+    },
+    assignee_removed: function (change) {
+      var span = assignee(change);
+      if (span) span.parentNode.removeChild(span);
+      else anyUnloaded();
+    },
+    group_renamed: function (change) {
+      var el = group(change.group);
+      if (!el) return false;
+      el.querySelector('.group-title').textContent = change.title;
+    },
+    group_deleted: function (change) {
+      var el = group(change.group);
+      if (el) el.parentNode.removeChild(el);
+    },
+    progress: function (change) {
+      board.querySelector('.board-progress').innerHTML = change.html;
+
+      for (var id in change.groups) {
+        var el = group(id);
+        if (el) el.querySelector('.group-progress').innerHTML = change.groups[id];
+      }
+    }
+  };
+
+  var source = new EventSource(board.getAttribute('data-events'));
+
+  source.onmessage = function (message) {
+    var event = JSON.parse(message.data);
+
+    // Sent once per connection with the current version only.
+    if (event.changes === null) {
+      if (event.version !== version) window.location.reload();
+      return;
+    }
+
+    if (event.version <= version) {
+      return;
+    }
+
+    if (event.version !== version + 1) {
+      window.location.reload();
+      return;
+    }
+
+    for (var i = 0; i < event.changes.length; i++) {
+      var handler = handlers[event.changes[i].type];
+
+      if (!handler || handler(event.changes[i]) === false) {
+        source.close();
+        window.location.reload();
+        return;
+      }
+    }
+
+    version = event.version;
+  };
+})();